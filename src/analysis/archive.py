@@ -0,0 +1,165 @@
+"Single-file, deduplicated corpus archive that the analysis can read instead of the git repos."
+# buildArchive packs many project repos (userFiles/<user>/<project>.git) into
+# one file:
+#   header    magic, then offsets of the index and the commit table
+#   blobs     every distinct Screen1 blocks/form blob, zlib-compressed, once
+#   index     sorted fixed-size records (blob sha, offset, length)
+#   table     zlib-compressed JSON: per repo, its master commits in order as
+#             [hash, date_unix, ISO date, blocks blob sha, form blob sha]
+# CorpusArchive memory-maps the file, so blobs are read in place by binary
+# search over the index, without a process or a pack lookup per repo.
+# It has the read() of gitfilter.BlobReader and a listCommits like
+# gitfilter.listCommits, and gitfilter sends a repo's reads to it once it is
+# the active archive:
+#   archive.buildArchive(catalog.selectProjects('Debugging'), 'debugging.snaparc')
+#   gitfilter.useArchive('debugging.snaparc')
+#   allp = main.processCorpus(gitfilter.activeArchive.projects())
+import os
+import json
+import mmap
+import zlib
+import struct
+import gitfilter as git
+
+magic = b'SNAPARC1'
+header = struct.Struct('<8sQQQQ')       # magic, index offset, index count, table offset, table length
+record = struct.Struct('<20sQI')        # blob sha, offset, compressed length
+
+def isoDatesOf(git_dir):
+    "Commit hash -> ISO committer date, for master."
+    result = git.doGit(['log', '--format=%H %cI', 'master'], git_dir)
+    return dict(line.split(' ', 1) for line in result.stdout.splitlines() if line)
+
+def buildArchive(projects, filename, reportEvery=100):
+    '''Writes the master history and snapshot files of every project into one archive.
+    Projects are repo paths, and are found in the archive under the same strings.
+    Returns the number of distinct blobs stored.'''
+    table = {}
+    offsets = {}        # blob sha -> (offset, length)
+    fileKeys = list(git.snapshotFiles)      # blob columns of the commit table, in this order
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header.pack(magic, 0, 0, 0, 0))
+        for n, p in enumerate(projects):
+            commits = git.listCommits(p)
+            if not isinstance(commits, list):
+                print('Skipping ' + p + ': git log failed')
+                continue
+            dates = isoDatesOf(p)
+            rows = []
+            with git.BlobReader(p) as reader:
+                for c in commits:
+                    shas = [c['blobs'].get(k) for k in fileKeys]
+                    for sha in shas:
+                        if sha is not None and sha not in offsets:
+                            _, text = reader.read(sha)
+                            data = zlib.compress(text.encode('utf-8'))
+                            offsets[sha] = (f.tell(), len(data))
+                            f.write(data)
+                    rows.append([c['hash'], c['date_unix'], dates.get(c['hash'], '')] + shas)
+            table[p] = rows
+            if reportEvery and (n + 1) % reportEvery == 0:
+                print('%d projects, %d blobs, %d MB' % (n + 1, len(offsets), f.tell() // 2**20))
+        indexOffset = f.tell()
+        for sha in sorted(offsets):
+            f.write(record.pack(bytes.fromhex(sha), *offsets[sha]))
+        tableOffset = f.tell()
+        data = zlib.compress(json.dumps({'files': fileKeys, 'repos': table}).encode('utf-8'))
+        f.write(data)
+        f.seek(0)
+        f.write(header.pack(magic, indexOffset, len(offsets), tableOffset, len(data)))
+    os.replace(tmp, filename)
+    return len(offsets)
+
+class CorpusArchive:
+    "Read access to an archive written by buildArchive, see the module comment."
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, self.indexOffset, self.count, tableOffset, tableLength = header.unpack_from(self.map, 0)
+        if tag != magic:
+            raise ValueError(filename + ' is not a corpus archive')
+        d = json.loads(zlib.decompress(self.map[tableOffset:tableOffset + tableLength]))
+        self.repos = d['repos']
+        self.files = d['files']
+        # path in the repo -> column of its blob sha in a commit row
+        self.column = {git.snapshotFiles[k]: 3 + n for (n, k) in enumerate(self.files)}
+        # commit hash -> its row, for reads named '<hash>:<path>'
+        self.rows = {row[0]: row for rows in self.repos.values() for row in rows}
+
+    def __contains__(self, git_dir):
+        return git_dir in self.repos
+
+    def projects(self):
+        return list(self.repos)
+
+    def find(self, sha):
+        "Returns (offset, length) of a blob, or None, by binary search over the index."
+        key = bytes.fromhex(sha)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self.indexOffset + mid * record.size
+            midKey = self.map[pos:pos + 20]
+            if midKey < key:
+                lo = mid + 1
+            elif midKey > key:
+                hi = mid
+            else:
+                _, offset, length = record.unpack_from(self.map, pos)
+                return offset, length
+        return None
+
+    def blob(self, sha):
+        "Text of a blob, or None if the archive doesn't have it."
+        found = self.find(sha) if sha else None
+        if found is None:
+            return None
+        offset, length = found
+        return zlib.decompress(self.map[offset:offset + length]).decode('utf-8')
+
+    def read(self, objname):
+        "As BlobReader.read: (blob sha, text) for '<commit>:<path>' or a blob sha, or (None, None)."
+        if ':' in objname:
+            commit_hash, path = objname.split(':', 1)
+            row = self.rows.get(commit_hash)
+            if row is None or path not in self.column:
+                return None, None
+            sha = row[self.column[path]]
+        else:
+            sha = objname
+        text = self.blob(sha)
+        return (sha, text) if text is not None else (None, None)
+
+    def listCommits(self, git_dir, since=None):
+        "As gitfilter.listCommits, from the archive."
+        rows = self.repos[git_dir]
+        if since is not None:
+            hashes = [row[0] for row in rows]
+            rows = rows[hashes.index(since) + 1:] if since in hashes else []
+        commits = []
+        for row in rows:
+            c = git.makeCommit(row[0], row[1], row[2], git_dir)
+            c['blobs'] = dict(zip(self.files, row[3:]))
+            commits.append(c)
+        return commits
+
+    def readFormAt(self, git_dir, rev='master'):
+        "As gitfilter.readFormAt: form text at a commit hash, or at the last commit for 'master'."
+        rows = self.repos[git_dir]
+        row = rows[-1] if rev == 'master' and rows else self.rows.get(rev)
+        if row is None:
+            return None
+        return self.blob(row[self.column[git.snapshotFiles['Screen1/form']]])
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,86 @@
+"Check that every blockparser backend builds the same block table as the etree backend."
+# Parses the snapshots of a synthetic history (synthetic.py), plus hand-written
+# edge cases, with each available backend and compares every column of the
+# resulting BlockTables to BlockTable.fromTree of the ElementTree parse. Broken
+# XML must raise one of blockparser.parseErrors with every backend, so that
+# xml_analyze.parseBlocks falls back instead of failing the project.
+#   python backendcheck.py              exit with status 1 if a backend differs
+import sys
+import argparse
+import xml.etree.ElementTree as ET
+import synthetic
+import blocktable
+import blockparser
+
+NS = 'xmlns="http://www.w3.org/1999/xhtml"'
+edgeCases = [
+    # repeated field names, a field dropped, an empty field
+    '<xml %s><block type="a" id="1" x="1" y="2"><field name="A">x</field><field name="B">y</field></block></xml>',
+    '<xml %s><block type="a" id="1" x="1" y="2"><field name="A">x</field></block></xml>',
+    '<xml %s><block type="a" id="1" x="1" y="2"><field name="A"></field><field name="B">z</field></block></xml>',
+    # a repeated id, mutations and comments
+    '<xml %s><block type="a" id="1" x="1.0" y="2"><field name="A">x</field><next><block id="1" type="b"/></next></block></xml>',
+    '<xml %s><block type="a" id="1"><mutation k="1"/><field name="A">x</field><comment w="3">hi</comment></block></xml>',
+    '<xml %s><block type="q" id="2" x="1" y="1"><statement name="D"><block type="r" id="3"/></statement></block></xml>',
+    # a field with child elements: only the text before the first child counts
+    '<xml %s><block type="a" id="1"><field name="A">x<b>y</b>z</field><field name="B">w</field></block></xml>',
+    '<xml %s><block type="a" id="1"><field name="A"><b>y</b></field></block></xml>',
+    '<xml %s><block type="a" id="1"><field name="A">x<block type="q" id="2"><field name="C">c</field></block>z</field></block></xml>',
+    # no blocks
+    '<xml %s></xml>',
+]
+brokenCases = ['<xml %s><block type="a" id="1">', '<xml %s><block></xml>', 'not xml']
+
+def tableOf(blocksXML, backend):
+    "The BlockTable a backend gives for blocks XML."
+    blockparser.setBackend(backend)
+    if backend == 'stream':
+        return blockparser.parseTable(blocksXML)
+    return blocktable.BlockTable.fromTree(blockparser.fromstring(blocksXML))
+
+def differingColumns(tableA, tableB):
+    return [k for k in blocktable.BlockTable.__slots__ if getattr(tableA, k) != getattr(tableB, k)]
+
+def runChecks(blocks=120, depth=5, commits=60, seed=0):
+    "Returns True if every backend matches etree on every snapshot."
+    backends = [b for b in blockparser.backends if b != 'lxml' or blockparser.lxmlET is not None]
+    snapshots = synthetic.generateHistory(blocks, depth, commits, seed=seed) + [s % NS for s in edgeCases]
+    previousBackend = blockparser.backend
+    ok = True
+    try:
+        for backend in backends:
+            bad = 0
+            for n, text in enumerate(snapshots):
+                expected = blocktable.BlockTable.fromTree(ET.fromstring(text))
+                try:
+                    columns = differingColumns(tableOf(text, backend), expected)
+                except Exception as e:
+                    columns = [type(e).__name__ + ': ' + str(e)]
+                if columns:
+                    bad = bad + 1
+                    print('%s: snapshot %d differs in %s' % (backend, n, ', '.join(columns)))
+            for text in brokenCases:
+                try:
+                    tableOf(text % NS if '%s' in text else text, backend)
+                    print('%s: broken XML parsed without an error' % backend)
+                    bad = bad + 1
+                except blockparser.parseErrors:
+                    pass
+                except Exception as e:
+                    print('%s: broken XML raised %s, not a parse error' % (backend, type(e).__name__))
+                    bad = bad + 1
+            print('%-6s %d snapshots, %d broken: %s' % (backend, len(snapshots), len(brokenCases),
+                                                        'ok' if not bad else '%d differ' % bad))
+            ok = ok and not bad
+    finally:
+        blockparser.setBackend(previousBackend)
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the blockparser backends build the same block tables.')
+    parser.add_argument('--blocks', type=int, default=120, help='program size, in blocks')
+    parser.add_argument('--commits', type=int, default=60, help='commits per history')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if not runChecks(args.blocks, commits=args.commits, seed=args.seed):
+        sys.exit(1)
@@ -0,0 +1,182 @@
+"Benchmarks of the analysis pipeline on synthetic histories, with a regression check."
+# Times each stage on histories from synthetic.py, for a range of program
+# sizes, so the results show how each stage scales:
+#   load        xml.loadChangeContents per commit (blob read + parse)
+#   parse (b)   xml.parseBlocks per snapshot with each blockparser backend b
+#   <detector>  each etree detector, and the fused block table detector, per pair
+#   diff        exact (difflib) and fast (linediff) getBlocksDiff, per pair
+#   extract     main.extractChanges per pair
+#   project     main.processProject end to end, per commit
+# All times are the best of `repeat` runs, in milliseconds. The pipeline runs
+# with the current blockparser backend (--backend); with 'stream' there are
+# no etree detector timings.
+#
+#   python benchmark.py                         run and print the table
+#   python benchmark.py --save baseline.json    also save the results
+#   python benchmark.py --baseline baseline.json --threshold 0.25
+#        exit with status 1 if any timing is over 25% slower than the baseline
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import synthetic
+import main
+import xml_analyze as xml
+import gitfilter as git
+import blocktable
+import blockparser
+import snapcache
+
+defaultSizes = [50, 200, 800]
+
+def best(f, repeat):
+    "Best wall time of repeat calls of f, in milliseconds."
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def loadAll(repo):
+    commits = git.listCommits(repo)
+    for c in commits:
+        xml.loadChangeContents(c, 'bench', 0)
+    git.closeBlobReader(repo)
+    return commits
+
+def parseAll(texts, backend):
+    "Parses every blocks text with the given blockparser backend."
+    current = blockparser.backend
+    blockparser.setBackend(backend)
+    try:
+        for t in texts:
+            xml.parseBlocks(t, 'bench', {'dir': '', 'hash': ''})
+    finally:
+        blockparser.setBackend(current)
+
+def availableBackends():
+    return [b for b in blockparser.backends if b != 'lxml' or blockparser.lxmlET is not None]
+
+def withoutTable(commit):
+    return {k: v for (k, v) in commit.items() if k != 'table'}
+
+def detectors(prev, cur):
+    "Name -> function timing one detector on the pair."
+    if 'etree' not in prev:
+        return {
+            'detectChanges(table)': lambda: blocktable.detectChanges(prev['table'], cur['table']),
+            'getBlocksDiff': lambda: xml.getBlocksDiff(prev, cur),
+            'getBlocksDiff(fast)': lambda: xml.getBlocksDiff(prev, cur, fast=True),
+            'extractChanges': lambda: main.extractChanges(prev, cur),
+        }
+    # the maps are built before timing, as plain dicts, like the eager maps they replaced
+    idA, idB = prev['IDmap'].built(), cur['IDmap'].built()
+    parentA, parentB = prev['parentmap'].built(), cur['parentmap'].built()
+    return {
+        'checkForDeletedAddedBlocks': lambda: xml.checkForDeletedAddedBlocks(prev['etree'], cur['etree']),
+        'checkForMovedBlocks': lambda: xml.checkForMovedBlocks(idA, idB),
+        'checkForContextMove': lambda: xml.checkForContextMove(idA, idB, parentA, parentB),
+        'checkForChangedBlocks': lambda: xml.checkForChangedBlocks(idA, idB),
+        'checkForFieldChanges': lambda: xml.checkForFieldChanges(idA, idB),
+        'detectChanges(etree)': lambda: main.detectChanges(withoutTable(prev), withoutTable(cur)),
+        'detectChanges(table)': lambda: blocktable.detectChanges(prev['table'], cur['table']),
+        'getBlocksDiff': lambda: xml.getBlocksDiff(prev, cur),
+        'getBlocksDiff(fast)': lambda: xml.getBlocksDiff(prev, cur, fast=True),
+        'extractChanges': lambda: main.extractChanges(prev, cur),
+    }
+
+def benchmarkSize(folder, blocks, depth, commits, repeat, seed):
+    "Timings for one program size. Per-pair timings are averaged over the history."
+    repo = synthetic.makeProject(folder, blocks, depth, commits, seed=seed, project='Bench%d' % blocks)
+    loaded = loadAll(repo)
+    results = {'blocks': len(loaded[0]['table'])}
+
+    def load():
+        loadAll(repo)
+    results['load'] = best(load, repeat) / commits
+
+    texts = [c['contents']['Screen1/blocks'] for c in loaded]
+    for backend in availableBackends():
+        results['parse (%s)' % backend] = best(lambda: parseAll(texts, backend), repeat) / len(texts)
+
+    pairs = list(zip(loaded, loaded[1:]))
+    totals = {}
+    for prev, cur in pairs:
+        for name, f in detectors(prev, cur).items():
+            totals[name] = totals.get(name, 0) + best(f, repeat)
+    for name, total in totals.items():
+        results[name] = total / len(pairs)
+
+    def project():
+        main.processProject(repo)
+    results['project'] = best(project, repeat) / commits
+    return results
+
+def runBenchmarks(sizes=defaultSizes, depth=5, commits=100, repeat=3, seed=0):
+    '''Returns {'config': ..., 'results': {size: {stage: ms}}}.
+    The snapshot cache is turned off while timing, so every run does the work.'''
+    cache = snapcache.activeCache
+    snapcache.disableCache()
+    folder = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        results = {str(size): benchmarkSize(folder, size, depth, commits, repeat, seed) for size in sizes}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+        snapcache.activeCache = cache
+    return {'config': {'sizes': sizes, 'depth': depth, 'commits': commits, 'repeat': repeat, 'seed': seed,
+                       'backend': blockparser.backend},
+            'results': results}
+
+def printTable(report):
+    sizes = list(report['results'])
+    stages = [s for s in report['results'][sizes[0]] if s != 'blocks']
+    width = max(len(s) for s in stages) + 2
+    print('ms per commit'.ljust(width) + ''.join(('%s blocks' % report['results'][s]['blocks']).rjust(14) for s in sizes))
+    for stage in stages:
+        print(stage.ljust(width) + ''.join(('%.3f' % report['results'][s][stage]).rjust(14) for s in sizes))
+
+def compareToBaseline(report, baseline, threshold=0.25, minimum=0.05):
+    '''Returns a list of (size, stage, baseline ms, ms) for every timing more than
+    threshold (a fraction) slower than the baseline. Timings under minimum ms in
+    the baseline are too noisy to compare and are skipped.'''
+    regressions = []
+    for size, stages in report['results'].items():
+        base = baseline['results'].get(size, {})
+        for stage, ms in stages.items():
+            if stage == 'blocks' or stage not in base or base[stage] < minimum:
+                continue
+            if ms > base[stage] * (1 + threshold):
+                regressions.append((size, stage, base[stage], ms))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on synthetic histories.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=defaultSizes, help='program sizes, in blocks')
+    parser.add_argument('--depth', type=int, default=5, help='nesting depth of the programs')
+    parser.add_argument('--commits', type=int, default=100, help='commits per history')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per timing, the best is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=blockparser.backends, default=blockparser.backend,
+                        help='blockparser backend for the pipeline')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown vs the baseline, as a fraction')
+    args = parser.parse_args()
+    blockparser.setBackend(args.backend)
+
+    report = runBenchmarks(args.sizes, args.depth, args.commits, args.repeat, args.seed)
+    printTable(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compareToBaseline(report, json.load(f), args.threshold)
+        for (size, stage, base, ms) in regressions:
+            print('REGRESSION %s at %s blocks: %.3f ms -> %.3f ms' % (stage, size, base, ms))
+        if regressions:
+            sys.exit(1)
+        print('No regressions over %d%% against %s' % (args.threshold * 100, args.baseline))
@@ -0,0 +1,157 @@
+"Parser backends for blocks XML, used by xml_analyze.parseBlocks."
+# Backends:
+#   'etree'   xml.etree.ElementTree; gives etree, IDmap, parentmap and table (the default)
+#   'lxml'    the same, parsed with lxml, if it is installed
+#   'stream'  only the table, built straight from pyexpat events, with no elements at all
+# The block table is all that main.extractChanges needs, so 'stream' skips the
+# element tree, and nothing builds the IDmap or parentmap unless it reads them
+# (xml_analyze.LazyMap). Code that still needs the etree, IDmap or parentmap of
+# a commit (the etree detectors in xml_analyze) needs a tree backend. Tags keep
+# their namespace, as '{http://www.w3.org/1999/xhtml}block'.
+#   blockparser.setBackend('stream')
+#
+# Measured on a 3200 block synthetic program (xml_analyze.parseBlocks, timeit):
+#   backend   parse ms   held after parse   cached snapshot   unpickle ms
+#   etree        34          6.3 MB             1.4 MB            17
+#   lxml         38            -                  -                -
+#   stream       31          1.1 MB             0.3 MB             1
+# Both ms columns include building the table, which every backend does and
+# which costs more than the parse itself: a bare ElementTree parse with the
+# two maps is 12 ms, and expat calling handlers that do nothing already takes
+# 8 ms of that. So 'stream' is not a faster parser than the baseline
+# ElementTree parse; its gains are memory, and snapshot cache hits (snapcache)
+# that load about 25x faster. lxml parses faster than expat,
+# but walking its elements to build the table is slower, so it is
+# not the default. lxml trees can't be pickled, so with 'lxml' snapshots are
+# not cached (features still are). Snapshot cache entries are kept apart by
+# what they hold (see cacheKind), so a table-only entry written under 'stream'
+# is never handed to a tree backend.
+import xml.etree.ElementTree as ET
+import xml.parsers.expat as expat
+import blocktable
+import xml_analyze as xml
+
+try:
+    import lxml.etree as lxmlET
+except ImportError:
+    lxmlET = None
+
+backends = ['etree', 'lxml', 'stream']
+backend = 'etree'
+
+# what a failed parse raises, for every backend
+parseErrors = (ET.ParseError, expat.ExpatError) if lxmlET is None else \
+    (ET.ParseError, expat.ExpatError, lxmlET.XMLSyntaxError)
+
+def setBackend(name):
+    global backend
+    if name not in backends:
+        raise ValueError('unknown parser backend ' + repr(name) + ', use one of ' + str(backends))
+    if name == 'lxml' and lxmlET is None:
+        raise ImportError('the lxml backend needs lxml')
+    backend = name
+
+def buildsTree():
+    "Does the backend give etree, IDmap and parentmap, or just the table?"
+    return backend != 'stream'
+
+if lxmlET is not None:
+    # comments and processing instructions would show up as children otherwise
+    lxmlParser = lxmlET.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+
+def fromstring(blocksXML):
+    "Parses blocks XML into an element tree, with the tree backend."
+    if backend == 'lxml':
+        # lxml refuses str input with an encoding declaration
+        return lxmlET.fromstring(blocksXML.encode('utf-8'), lxmlParser)
+    return ET.fromstring(blocksXML)
+
+def treeTag(name):
+    "ElementTree's tag for a pyexpat element name."
+    return '{' + name if '}' in name else name
+
+class TableBuilder:
+    '''pyexpat handlers that build a BlockTable from start/end/character data events.
+    Rows are added at each block's start tag, so they are in document order as
+    with BlockTable.fromTree; digests of a block's children are set at its end tag.
+    Character data is only handled inside fields, while their text is read.'''
+
+    def __init__(self, parser):
+        self.parser = parser
+        # pyexpat names namespaced elements 'uri}tag' with namespace_separator='}'
+        self.blockName = xml.BLOCK[1:]
+        self.fieldName = xml.FIELD[1:]
+        self.table = blocktable.BlockTable()
+        # per open element: (row if it is a block else None, nearest block row,
+        # socket that blocks directly inside it are plugged into)
+        self.open = [(None, -1, None)]
+        self.attribs = {}       # row -> attributes, while the block is open
+        self.children = {}      # row -> childKeys of non-field children
+        self.texts = []         # row -> field texts
+        # per open field of a block: (depth of its entry in open, text data);
+        # its text, like an Element's .text, is the data before its first child
+        self.fields = []
+        self.inText = False
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+
+    def stopText(self):
+        self.parser.CharacterDataHandler = None
+        self.inText = False
+
+    def start(self, name, attrib):
+        if self.inText:
+            self.stopText()
+        parentRow, nearest, socket = self.open[-1]
+        if parentRow is not None:
+            if name == self.fieldName:
+                self.fields.append((len(self.open), []))
+                self.parser.CharacterDataHandler = self.fields[-1][1].append
+                self.inText = True
+            else:
+                self.children[parentRow].append(blocktable.childKey(treeTag(name), attrib))
+        if name == self.blockName:
+            row = self.table.addRow(attrib, nearest, socket)
+            self.attribs[row] = attrib
+            self.children[row] = []
+            self.texts.append([])
+            self.open.append((row, row, None))
+        elif nearest >= 0:
+            # the nearest wrapper below the parent block names the socket
+            self.open.append((None, nearest, blocktable.socketName(name, attrib)))
+        else:
+            self.open.append((None, nearest, socket))
+
+    def end(self, name):
+        if self.inText:
+            self.stopText()
+        row, _, _ = self.open.pop()
+        if row is not None:
+            self.table.setContent(row, self.attribs.pop(row), self.children.pop(row), self.texts[row])
+        elif self.fields and self.fields[-1][0] == len(self.open):
+            # an element's text is None when it has none, as in the tree
+            _, text = self.fields.pop()
+            self.texts[self.open[-1][0]].append(''.join(text) or None)
+
+    def close(self):
+        # the parser holds our handlers: let go of it, so neither waits for the cycle collector
+        self.parser = None
+        table = self.table
+        for texts in self.texts:
+            table.addFields(texts)
+        table.hashSubtrees()
+        return table
+
+def parseTable(blocksXML):
+    "Builds the BlockTable of blocks XML in one streaming pass, without an element tree."
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+    builder = TableBuilder(parser)
+    parser.Parse(blocksXML, True)
+    return builder.close()
+
+def cacheKind():
+    "What the backend's parsed snapshots hold in the snapshot cache: 'tree', 'table', or None if they can't be cached."
+    if backend == 'lxml':
+        return None
+    return 'tree' if buildsTree() else 'table'
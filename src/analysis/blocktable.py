@@ -0,0 +1,307 @@
+"Compact, array-backed table of the blocks in one snapshot, and detectors that run on it."
+# One row per block, in document order. Instead of keeping Elements around, each
+# row keeps what the detectors in xml_analyze compare, reduced to 64 bit digests:
+#   position  x/y of a top-level block          (checkForMovedBlocks)
+#   parent    row of the nearest parent block   (checkForContextMove)
+#   content   block attributes minus x/y, plus tag and attributes of each
+#             non-field child                   (checkForChangedBlocks)
+#   fields    text of every field, in order     (checkForFieldChanges);
+#             the texts themselves are kept too, for fieldsDiffer
+# On top of those, subtree is a Merkle-style digest of a block and everything
+# nested in it (ids, content, fields, child order, positions below it), built
+# bottom-up. Equal subtree digests let detectChanges skip a whole unchanged
+# stack, so its cost follows what changed rather than program size.
+# The same walk records each block's ancestry, for lookups without walking up
+# the tree (see stackOf, subtreeSize and friends):
+#   depth     number of blocks it is nested in, 0 at the top of the workspace
+#   socket    name of the value/statement socket it is plugged into, 'next'
+#             below another statement, None at the top of the workspace
+#   stack     row of the top-level block of its stack
+
+from array import array
+import hashlib
+import xml_analyze as xml
+
+def digest(value):
+    "Stable 64 bit digest of a value's repr, the same in every process."
+    return digestText(repr(value))
+
+def digestText(text):
+    "Stable 64 bit digest of a string."
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+# Each row is hashed as one joined string (or byte string) per column, not one
+# digest per value. The separators are control characters that can't occur in
+# XML 1.0, and '\0' stands for a missing value.
+def joinTexts(texts):
+    return '\x1f'.join('\0' if t is None else t for t in texts)
+
+def attribsNoXY(attrib):
+    "A block or child element's attributes minus x/y, as one string in a fixed order."
+    items = [k + '=' + v for (k, v) in attrib.items() if k != 'x' and k != 'y']
+    if len(items) > 1:
+        items.sort()
+    return '\x1f'.join(items)
+
+def childKey(tag, attrib):
+    "What a non-field child element adds to its block's content digest."
+    # most are <next> or <value name=...>, with one attribute or none
+    if not attrib:
+        return tag + '\x1e'
+    return tag + '\x1e' + attribsNoXY(attrib)
+
+def positionDigest(x, y):
+    return digestText(joinTexts((x, y)))
+
+# digests most blocks share: nested blocks have no position, many have no fields
+noPosition = positionDigest(None, None)
+noFields = digestText('')
+
+def socketName(tag, attrib):
+    "Name of the socket a wrapper element (value, statement, next) stands for."
+    return attrib.get('name') or tag.rsplit('}', 1)[-1]
+
+class BlockTable:
+    "Flat per-block columns for one snapshot. index maps block id -> row."
+    __slots__ = ['ids', 'types', 'index', 'parent', 'top', 'position',
+                 'content', 'fields', 'fieldStart', 'fieldTexts', 'subtree', 'size',
+                 'depth', 'socket', 'stack']
+
+    def __init__(self):
+        self.ids = []
+        self.types = []
+        self.index = {}
+        self.parent = array('i')        # -1 for blocks at the top of the workspace
+        self.top = array('b')           # block has both x and y
+        self.position = array('Q')
+        self.content = array('Q')
+        self.fields = array('Q')
+        # the field texts of row r are fieldTexts[fieldStart[r]:fieldStart[r + 1]]
+        self.fieldStart = array('l', [0])
+        self.fieldTexts = []
+        # rows are in document order, so row r's subtree is rows r .. r + size[r] - 1
+        self.subtree = array('Q')
+        self.size = array('l')
+        self.depth = array('i')
+        self.socket = []
+        self.stack = array('l')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def addBlock(self, block, parentRow, socket=None):
+        "Appends a row for a block Element, returns the row number."
+        row = self.addRow(block.attrib, parentRow, socket)
+        texts = []
+        children = []
+        for child in block:
+            if child.tag == xml.FIELD:
+                texts.append(child.text)
+            else:
+                children.append(childKey(child.tag, child.attrib))
+        self.addFields(texts)
+        self.setContent(row, block.attrib, children, texts)
+        return row
+
+    # addRow, setContent and addFields build a row in pieces, for parsers that
+    # see a block's attributes before its children (blockparser.TableBuilder).
+    def addRow(self, attrib, parentRow, socket=None):
+        "Appends a row for a block with these attributes, returns the row number."
+        row = len(self.ids)
+        blockID = attrib.get('id')
+        self.ids.append(blockID)
+        self.types.append(attrib.get('type'))
+        # like makeIDtoBlockMap, a repeated id maps to its last occurrence
+        self.index[blockID] = row
+        self.parent.append(parentRow)
+        if parentRow < 0:
+            self.depth.append(0)
+            self.stack.append(row)
+        else:
+            self.depth.append(self.depth[parentRow] + 1)
+            self.stack.append(self.stack[parentRow])
+        self.socket.append(socket)
+        x = attrib.get('x')
+        y = attrib.get('y')
+        self.top.append((x is not None) & (y is not None))
+        self.position.append(noPosition if x is None and y is None else positionDigest(x, y))
+        self.content.append(0)
+        self.fields.append(0)
+        return row
+
+    def setContent(self, row, attrib, children, texts):
+        "Sets a row's digests from its attributes, childKeys of non-field children, and field texts."
+        self.content[row] = digestText(attribsNoXY(attrib) + '\x1d' + '\x1d'.join(children))
+        self.fields[row] = digestText('\x1d' + joinTexts(texts)) if texts else noFields
+
+    def addFields(self, texts):
+        "Appends the field texts of the next row (rows take their fields in row order)."
+        self.fieldTexts.extend(texts)
+        self.fieldStart.append(len(self.fieldTexts))
+
+    @classmethod
+    def fromTree(cls, treeroot):
+        "Builds the table from a parsed blocks tree, in one walk over it."
+        table = cls()
+        stack = [(treeroot, -1, None)]
+        while stack:
+            element, parentRow, socket = stack.pop()
+            if element.tag == xml.BLOCK:
+                parentRow = table.addBlock(element, parentRow, socket)
+                socket = None
+            elif parentRow >= 0:
+                # the nearest wrapper below the parent block names the socket
+                socket = socketName(element.tag, element.attrib)
+            for child in reversed(element):
+                stack.append((child, parentRow, socket))
+        table.hashSubtrees()
+        return table
+
+    def hashSubtrees(self):
+        "Fills subtree and size bottom-up, children before their parents."
+        n = len(self.ids)
+        self.subtree = array('Q', bytes(8 * n))
+        self.size = array('l', [1]) * n
+        ids, content, fields, parent = self.ids, self.content, self.fields, self.parent
+        blake2b = hashlib.blake2b
+        children = [[] for _ in range(n)]
+        for r in range(n - 1, -1, -1):
+            # children were appended last to first, each as (position, subtree):
+            # reversed, that is (subtree, position) per child in order
+            kids = children[r]
+            kids.reverse()
+            key = ('\0' if ids[r] is None else ids[r]).encode('utf-8') + b'\x1f' + \
+                array('Q', [content[r], fields[r]] + kids).tobytes()
+            h = int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+            self.subtree[r] = h
+            p = parent[r]
+            if p >= 0:
+                # a nested block's position counts as part of its parent's subtree
+                children[p].append(self.position[r] if self.top[r] else 0)
+                children[p].append(h)
+                self.size[p] = self.size[p] + self.size[r]
+
+    def parentID(self, row):
+        "Id of the nearest parent block of a row, None for top-level blocks (as the root has no id)."
+        p = self.parent[row]
+        return None if p < 0 else self.ids[p]
+
+    # Ancestry lookups by block id, O(1) each. An unknown id raises KeyError.
+    def parentOf(self, blockID):
+        "Id of the nearest parent block, None at the top of the workspace."
+        return self.parentID(self.index[blockID])
+
+    def depthOf(self, blockID):
+        return self.depth[self.index[blockID]]
+
+    def socketOf(self, blockID):
+        "Socket the block is plugged into (e.g. 'DO', 'VALUE', 'next'), None at the top."
+        return self.socket[self.index[blockID]]
+
+    def stackOf(self, blockID):
+        "Id of the top-level block of the stack the block is in."
+        return self.ids[self.stack[self.index[blockID]]]
+
+    def subtreeSize(self, blockID):
+        "Number of blocks in the block's subtree, itself included."
+        return self.size[self.index[blockID]]
+
+    def subtreeIDs(self, blockID):
+        "Ids of the block and every block nested in it, in document order."
+        row = self.index[blockID]
+        return self.ids[row:row + self.size[row]]
+
+    def stacks(self):
+        "Ids of the top-level blocks, in document order."
+        return [self.ids[r] for r in range(len(self.ids)) if self.parent[r] < 0]
+
+    def fieldsDiffer(self, row, other, otherRow):
+        "didThisBlocksFieldsChange: does any field differ, pairing fields in order?"
+        if self.fields[row] == other.fields[otherRow]:
+            return False
+        a = self.fieldTexts[self.fieldStart[row]:self.fieldStart[row + 1]]
+        b = other.fieldTexts[other.fieldStart[otherRow]:other.fieldStart[otherRow + 1]]
+        return any(fa != fb for (fa, fb) in zip(a, b))
+
+#########################################################
+########  Operates on SAME TREE, DIFFERENT TIME  ########
+# Same results as the functions of the same name in xml_analyze.
+
+def checkForDeletedAddedBlocks(tableA, tableB):
+    "Returns lists: deleted and added blocks from A to B."
+    setA = frozenset(tableA.ids)
+    setB = frozenset(tableB.ids)
+    return list(setA.difference(setB)), list(setB.difference(setA))
+
+def checkForMovedBlocks(tableA, tableB):
+    "Returns list: top-level blocks that moved on the workspace from A to B."
+    ia, ib = tableA.index, tableB.index
+    return [i for i in xml.commonKeys(ia, ib) if
+            tableA.top[ia[i]] and tableB.top[ib[i]] and
+            tableA.position[ia[i]] != tableB.position[ib[i]]]
+
+def checkForContextMove(tableA, tableB):
+    "Returns list: blocks that moved in context, having a new parent, from A to B"
+    ia, ib = tableA.index, tableB.index
+    return [i for i in xml.commonKeys(ia, ib) if
+            tableA.parentID(ia[i]) != tableB.parentID(ib[i])]
+
+def checkForChangedBlocks(tableA, tableB):
+    "Returns list: blocks that changed (not moved) from A to B, common to A&B"
+    ia, ib = tableA.index, tableB.index
+    return [i for i in xml.commonKeys(ia, ib) if
+            tableA.content[ia[i]] != tableB.content[ib[i]]]
+
+def checkForFieldChanges(tableA, tableB):
+    "Returns list: blocks whose field(s) changed from A to B, common to A&B"
+    ia, ib = tableA.index, tableB.index
+    return [i for i in xml.commonKeys(ia, ib) if
+            tableA.fieldsDiffer(ia[i], tableB, ib[i])]
+
+def detectChanges(tableA, tableB):
+    '''Fused detector: one walk over the union of block ids fills every list above.
+    Returns (deleted, added, moved, context, changed, fields). The lists hold the
+    same ids as the separate detectors, in document order of A (B for added).
+    A block whose subtree digest is unchanged is compared by itself, and the
+    blocks nested in it are skipped: they cannot have changed.'''
+    ia, ib = tableA.index, tableB.index
+    topA, topB = tableA.top, tableB.top
+    posA, posB = tableA.position, tableB.position
+    parA, parB = tableA.parent, tableB.parent
+    idsA, idsB = tableA.ids, tableB.ids
+    contentA, contentB = tableA.content, tableB.content
+    fieldsA, fieldsB = tableA.fields, tableB.fields
+    subA, subB = tableA.subtree, tableB.subtree
+    sizeA = tableA.size
+    # with repeated ids, rows and ids don't line up one to one: don't skip
+    canSkip = len(ia) == len(idsA) and len(ib) == len(idsB)
+    deleted, moved, context, changed, fields = [], [], [], [], []
+    common = 0
+    rows = range(len(idsA)) if canSkip else ia.values()
+    skipTo = 0
+    for a in rows:
+        if a < skipTo:
+            continue
+        i = idsA[a]
+        b = ib.get(i, -1)
+        if b < 0:
+            deleted.append(i)
+            continue
+        common = common + 1
+        if topA[a] and topB[b] and posA[a] != posB[b]:
+            moved.append(i)
+        pa, pb = parA[a], parB[b]
+        if (None if pa < 0 else idsA[pa]) != (None if pb < 0 else idsB[pb]):
+            context.append(i)
+        if contentA[a] != contentB[b]:
+            changed.append(i)
+        if fieldsA[a] != fieldsB[b] and tableA.fieldsDiffer(a, tableB, b):
+            fields.append(i)
+        if canSkip and subA[a] == subB[b]:
+            skipTo = a + sizeA[a]
+            common = common + sizeA[a] - 1
+    if common == len(ib):
+        added = []
+    else:
+        added = sorted(ib.keys() - ia.keys(), key=ib.get)
+    return deleted, added, moved, context, changed, fields
@@ -0,0 +1,127 @@
+"Persistent SQLite catalog of the corpus: users, repos, activity, commit counts and times."
+# Built once with buildCatalog('userFiles'), after which project selection is a
+# query instead of a walk over every user folder and a git log per repo:
+#   selectProjects('Debugging', minCommits=51)
+# Rebuilding only re-examines repos whose master moved since the last build.
+import os
+import sqlite3
+import subprocess
+import concurrent.futures
+import gitfilter as git
+
+catalogFile = 'catalog.sqlite'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    folder TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS repos (
+    path TEXT PRIMARY KEY,
+    user TEXT NOT NULL REFERENCES users(name),
+    activity TEXT,
+    commits INTEGER NOT NULL,
+    first_time INTEGER,
+    last_time INTEGER,
+    head TEXT);
+CREATE INDEX IF NOT EXISTS repos_by_activity ON repos (activity, commits);
+CREATE INDEX IF NOT EXISTS repos_by_user ON repos (user);
+'''
+
+def connect(dbfile=catalogFile):
+    db = sqlite3.connect(dbfile)
+    db.executescript(schema)
+    return db
+
+def headOf(repo):
+    "Returns the hash master points at, or None if repo isn't a readable git repo."
+    result = subprocess.run(['git', 'rev-parse', '--verify', '-q', 'master'], cwd=repo,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def describeRepo(repo, tests):
+    "Returns (activity, commits, first_time, last_time) of a repo, read at master."
+    result = git.doGit(['log', '--format=%ct', 'master'], repo)
+    times = [int(t) for t in result.stdout.split()]
+    form = git.readFormAt(repo)
+    activity = None
+    if form is not None:
+        activity = next((name for (name, test) in tests.items() if test(form)), None)
+    if not times:
+        return activity, 0, None, None
+    # git log lists newest first
+    return activity, len(times), times[-1], times[0]
+
+def buildCatalog(folder, dbfile=catalogFile, tests=git.activityTests, workers=16):
+    '''Creates or refreshes the catalog of every project under folder.
+    Repos whose master hash is unchanged since the last build are not looked at again;
+    repos (and users) that are gone, or now in ignore_users, are dropped.
+    activity is the name of the first test in tests that the form passes, or NULL.'''
+    db = connect(dbfile)
+    users = getUsers(folder)
+    repos = [(name, os.path.join(userFolder, r)) for (name, userFolder) in users
+             for r in git.getReposFrom(userFolder)]
+    known = dict(db.execute('SELECT path, head FROM repos'))
+
+    def examine(item):
+        user, repo = item
+        head = headOf(repo)
+        if head is None:
+            return None
+        if known.get(repo) == head:
+            return (user, repo, head, None)
+        return (user, repo, head, describeRepo(repo, tests))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(examine, repos))
+
+    updated = 0
+    with db:
+        db.executemany('INSERT OR REPLACE INTO users (name, folder) VALUES (?, ?)', users)
+        present = set()
+        for r in results:
+            if r is None:
+                continue
+            user, repo, head, description = r
+            present.add(repo)
+            if description is None:
+                continue
+            updated = updated + 1
+            db.execute('INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (repo, user) + description + (head,))
+        gone = [(p,) for p in known if p not in present]
+        db.executemany('DELETE FROM repos WHERE path = ?', gone)
+        db.execute('DELETE FROM users WHERE name NOT IN (SELECT DISTINCT user FROM repos)')
+    print('Catalog %s: %d repos, %d updated, %d removed' % (dbfile, len(present), updated, len(gone)))
+    db.close()
+
+def getUsers(folder):
+    "Returns (name, folder) of every user, leaving out ignore_users."
+    return [(os.path.basename(u), u) for u in git.getAllUsersIn(folder)]
+
+def selectProjects(activity=None, minCommits=0, maxCommits=None, dbfile=catalogFile):
+    '''Returns project paths from the catalog, sorted by path. Users in ignore_users
+    are always left out, even if they were added to it after the catalog was built.
+    e.g. selectProjects('Debugging', minCommits=51)'''
+    query = 'SELECT path FROM repos WHERE commits >= ?'
+    args = [minCommits]
+    if activity is not None:
+        query = query + ' AND activity = ?'
+        args.append(activity)
+    if maxCommits is not None:
+        query = query + ' AND commits <= ?'
+        args.append(maxCommits)
+    if git.ignore_users:
+        query = query + ' AND user NOT IN (%s)' % ','.join('?' * len(git.ignore_users))
+        args.extend(git.ignore_users)
+    db = connect(dbfile)
+    paths = [row[0] for row in db.execute(query + ' ORDER BY path', args)]
+    db.close()
+    return paths
+
+def describeProject(path, dbfile=catalogFile):
+    "Returns the catalog row of one project as a dict, or None."
+    db = connect(dbfile)
+    db.row_factory = sqlite3.Row
+    row = db.execute('SELECT * FROM repos WHERE path = ?', (path,)).fetchone()
+    db.close()
+    return dict(row) if row is not None else None
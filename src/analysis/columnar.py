@@ -0,0 +1,168 @@
+"Streaming, chunked columnar export of extracted features, next to main.printCSV."
+# Typed columns instead of CSV text:
+#   username, date, hash          strings
+#   seconds_elapsed               int64
+#   hasFeatures, one per flag     bool (flags are False for the first commit)
+#   one per *List feature         list of block ids, stored as offsets + values
+# Commits are consumed from any iterable, e.g. main.iterProject or a generator
+# over many projects, and written chunkRows at a time, so the corpus never has
+# to be in memory at once.
+#
+# Written as Parquet (one row group per chunk) when pyarrow is installed,
+# otherwise as NumPy .npz files, one per chunk: <filename>-00000.npz, ...
+# loadColumns reads either back into NumPy arrays.
+import os
+import glob
+import featureNames as names
+import instrument
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+stringColumns = ['username', 'date', 'hash']
+listColumns = [names.blocksDeletedList, names.blocksAddedList,
+               names.blocksMovedInSpaceList, names.blocksMovedContextList,
+               names.blocksFieldsChangedList, names.blocksChangedList]
+
+def flatten(changes):
+    "Yields commits from an iterable of commits, or of per-project lists or generators of them."
+    for c in changes:
+        if isinstance(c, dict):
+            yield c
+        else:
+            yield from c
+
+class ColumnChunk:
+    "Column buffers for up to chunkRows commits."
+
+    def __init__(self):
+        self.rows = 0
+        self.strings = {k: [] for k in stringColumns}
+        self.seconds = []
+        self.hasFeatures = []
+        self.flags = {f: [] for f in names.allFlags}
+        self.offsets = {k: [0] for k in listColumns}
+        self.values = {k: [] for k in listColumns}
+
+    def add(self, commit):
+        self.rows = self.rows + 1
+        for k in stringColumns:
+            self.strings[k].append(commit.get(k, ''))
+        self.seconds.append(commit.get('seconds_elapsed', 0))
+        features = commit.get(names.featureExtractionResults)
+        self.hasFeatures.append(features is not None)
+        features = features or {}
+        for f in names.allFlags:
+            self.flags[f].append(bool(features.get(f, False)))
+        for k in listColumns:
+            self.values[k].extend(features.get(k, ()))
+            self.offsets[k].append(len(self.values[k]))
+
+def writeNPZ(chunk, filename):
+    columns = {k: np.array(v, dtype=str) for (k, v) in chunk.strings.items()}
+    columns['seconds_elapsed'] = np.array(chunk.seconds, dtype=np.int64)
+    columns['hasFeatures'] = np.array(chunk.hasFeatures, dtype=bool)
+    for f in names.allFlags:
+        columns[f] = np.array(chunk.flags[f], dtype=bool)
+    for k in listColumns:
+        columns[k + '_offsets'] = np.array(chunk.offsets[k], dtype=np.int64)
+        columns[k + '_values'] = np.array(chunk.values[k], dtype=str)
+    np.savez_compressed(filename, **columns)
+
+def arrowTable(chunk):
+    columns = {k: pa.array(v, type=pa.string()) for (k, v) in chunk.strings.items()}
+    columns['seconds_elapsed'] = pa.array(chunk.seconds, type=pa.int64())
+    columns['hasFeatures'] = pa.array(chunk.hasFeatures, type=pa.bool_())
+    for f in names.allFlags:
+        columns[f] = pa.array(chunk.flags[f], type=pa.bool_())
+    for k in listColumns:
+        columns[k] = pa.ListArray.from_arrays(pa.array(chunk.offsets[k], type=pa.int32()),
+                                              pa.array(chunk.values[k], type=pa.string()))
+    return pa.table(columns)
+
+def chunkFiles(filename):
+    "The .npz chunks of an export, in order."
+    return sorted(glob.glob(glob.escape(filename) + '-[0-9][0-9][0-9][0-9][0-9].npz'))
+
+def removeChunks(filename):
+    '''Deletes the .npz chunks of an earlier export under the same name, so none
+    of them is read back. filename itself is never deleted: npz mode does not
+    write it (it may be another file), and parquet mode overwrites it.'''
+    for f in chunkFiles(filename):
+        os.remove(f)
+
+def exportColumns(changes, filename, chunkRows=50000, format=None):
+    '''Writes commits (any iterable, see flatten) as typed columns. Returns the files written.
+    An earlier export under the same filename is replaced.
+    format: 'parquet' or 'npz'; default is parquet if pyarrow is installed, else npz.'''
+    if format is None:
+        format = 'parquet' if pa is not None else 'npz'
+    if format == 'parquet' and pa is None:
+        raise ImportError('Parquet export needs pyarrow')
+    if np is None:
+        raise ImportError('Columnar export needs numpy')
+
+    removeChunks(filename)
+    files = []
+    writer = None
+    chunk = ColumnChunk()
+
+    def flush():
+        nonlocal writer, chunk
+        with instrument.stage('export'):
+            if format == 'parquet':
+                table = arrowTable(chunk)
+                if writer is None:
+                    writer = pq.ParquetWriter(filename, table.schema)
+                    files.append(filename)
+                writer.write_table(table)
+            else:
+                files.append('%s-%05d.npz' % (filename, len(files)))
+                writeNPZ(chunk, files[-1])
+        chunk = ColumnChunk()
+
+    for c in flatten(changes):
+        chunk.add(c)
+        if chunk.rows >= chunkRows:
+            flush()
+    if chunk.rows > 0 or not files:
+        flush()
+    if writer is not None:
+        writer.close()
+    return files
+
+def loadColumns(filename):
+    '''Reads an export back as a dict of NumPy arrays. List columns come back as
+    <name>_offsets / <name>_values, offsets counted over the whole export.'''
+    parts = chunkFiles(filename)
+    if not parts:
+        table = pq.read_table(filename)
+        columns = {}
+        for k in table.column_names:
+            col = table.column(k).combine_chunks()
+            if k in listColumns:
+                columns[k + '_offsets'] = np.asarray(col.offsets, dtype=np.int64)
+                columns[k + '_values'] = np.asarray(col.flatten().to_pylist(), dtype=str)
+            else:
+                columns[k] = col.to_numpy(zero_copy_only=False)
+        return columns
+
+    parts = [np.load(f) for f in parts]
+    columns = {}
+    for k in parts[0].files:
+        if k.endswith('_offsets'):
+            # re-base each chunk's offsets onto the values that come before it
+            pieces = [parts[0][k]]
+            for p in parts[1:]:
+                pieces.append(p[k][1:] + pieces[-1][-1])
+            columns[k] = np.concatenate(pieces)
+        else:
+            columns[k] = np.concatenate([p[k] for p in parts])
+    return columns
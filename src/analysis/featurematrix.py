@@ -0,0 +1,123 @@
+"NumPy feature matrix of processed commits, with vectorized group-by aggregation."
+# Rows are commits (in the order given), columns are the flags of names.allFlags.
+# Next to the flags are per-row user and project codes, seconds_elapsed,
+# date_unix and the length of every *List feature. Aggregations are bincounts
+# over the codes, instead of walking every change dict once per flag.
+#   m = FeatureMatrix.fromChanges(allp)
+#   m.flagCounts()                  same result as main.countAllChangeFlags
+#   m.groupCounts('user')           users x flags counts
+#   m.rates('project')              share of each project's commits with each flag
+#   m.histogram('user', 60)         commits per user per minute of activity
+import numpy as np
+import featureNames as names
+from columnar import flatten, listColumns as listNames
+
+class FeatureMatrix:
+    "Commits x flags matrix plus per-commit columns, see the module comment."
+
+    def __init__(self, flags, hasFeatures, listSizes, seconds, dateUnix,
+                 user, users, project, projects):
+        self.flags = flags              # bool, rows x len(names.allFlags)
+        self.hasFeatures = hasFeatures  # bool, False for each project's first commit
+        self.listSizes = listSizes      # int32, rows x len(listNames)
+        self.seconds = seconds          # int64 seconds_elapsed
+        self.dateUnix = dateUnix        # int64
+        self.user = user                # int32 codes into users
+        self.users = users
+        self.project = project          # int32 codes into projects
+        self.projects = projects
+
+    @classmethod
+    def fromChanges(cls, changes):
+        "Builds the matrix from commits (any iterable, e.g. allp or a generator)."
+        flags, has, sizes, seconds, dates, user, project = [], [], [], [], [], [], []
+        userCodes, projectCodes = {}, {}
+        for c in flatten(changes):
+            feat = c.get(names.featureExtractionResults)
+            has.append(feat is not None)
+            feat = feat or {}
+            flags.append([bool(feat.get(f, False)) for f in names.allFlags])
+            sizes.append([len(feat.get(k, ())) for k in listNames])
+            seconds.append(c.get('seconds_elapsed', 0))
+            dates.append(int(c['date_unix']))
+            user.append(userCodes.setdefault(c.get('username', ''), len(userCodes)))
+            project.append(projectCodes.setdefault(c.get('dir', ''), len(projectCodes)))
+        n = len(has)
+        return cls(np.array(flags, dtype=bool).reshape(n, len(names.allFlags)),
+                   np.array(has, dtype=bool),
+                   np.array(sizes, dtype=np.int32).reshape(n, len(listNames)),
+                   np.array(seconds, dtype=np.int64),
+                   np.array(dates, dtype=np.int64),
+                   np.array(user, dtype=np.int32), list(userCodes),
+                   np.array(project, dtype=np.int32), list(projectCodes))
+
+    def __len__(self):
+        return len(self.hasFeatures)
+
+    def flagColumn(self, flag):
+        return self.flags[:, names.allFlags.index(flag)]
+
+    def listSizeColumn(self, listName):
+        return self.listSizes[:, listNames.index(listName)]
+
+    def codes(self, by):
+        "Returns (codes, labels) for grouping by 'user' or 'project'."
+        if by == 'user':
+            return self.user, self.users
+        if by == 'project':
+            return self.project, self.projects
+        raise ValueError("group by 'user' or 'project', not " + repr(by))
+
+    def flagCounts(self, rows=None):
+        "Dict of flag -> number of commits with it, plus 'allChanges', as main.countAllChangeFlags."
+        flags = self.flags if rows is None else self.flags[rows]
+        counts = dict(zip(names.allFlags, flags.sum(axis=0).tolist()))
+        counts['allChanges'] = len(flags)
+        return counts
+
+    def groupCommits(self, by):
+        "Number of commits per group."
+        codes, labels = self.codes(by)
+        return np.bincount(codes, minlength=len(labels))
+
+    def groupCounts(self, by):
+        "Groups x flags matrix: commits of each group with each flag set."
+        codes, labels = self.codes(by)
+        return np.stack([np.bincount(codes, weights=self.flags[:, f], minlength=len(labels))
+                         for f in range(self.flags.shape[1])], axis=1).astype(np.int64)
+
+    def groupListTotals(self, by):
+        "Groups x lists matrix: total blocks listed in each *List feature per group."
+        codes, labels = self.codes(by)
+        return np.stack([np.bincount(codes, weights=self.listSizes[:, k], minlength=len(labels))
+                         for k in range(self.listSizes.shape[1])], axis=1).astype(np.int64)
+
+    def rates(self, by):
+        "Groups x flags matrix: share of the group's commits with each flag set."
+        commits = self.groupCommits(by)
+        return self.groupCounts(by) / np.maximum(commits, 1)[:, None]
+
+    def histogram(self, by, binSeconds=60, flag=None):
+        '''Groups x time bins matrix: commits (or, with flag, commits with that flag)
+        per group in each binSeconds-long slice of seconds_elapsed.'''
+        codes, labels = self.codes(by)
+        bins = self.seconds // binSeconds
+        nbins = int(bins.max()) + 1 if len(bins) else 0
+        weights = None if flag is None else self.flagColumn(flag)
+        counts = np.bincount(codes.astype(np.int64) * nbins + bins, weights=weights,
+                             minlength=len(labels) * nbins)
+        return counts.reshape(len(labels), nbins).astype(np.int64)
+
+    def summaryTable(self, by):
+        "One dict per group: commits, and count and rate of each flag."
+        counts = self.groupCounts(by)
+        commits = self.groupCommits(by)
+        _, labels = self.codes(by)
+        rows = []
+        for g, label in enumerate(labels):
+            row = {by: label, 'allChanges': int(commits[g])}
+            for f, flag in enumerate(names.allFlags):
+                row[flag] = int(counts[g, f])
+                row[flag + 'Rate'] = float(counts[g, f] / commits[g]) if commits[g] else 0.0
+            rows.append(row)
+        return rows
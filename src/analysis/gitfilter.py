@@ -1,6 +1,9 @@
 "Tools for analysis of Mark Sherman's snapshot block code data."
 import os
 import subprocess
+import concurrent.futures
+import instrument
+import archive
 
 # list of users to always ignore in data processing
 # used for test data, researcher accounts, etc
@@ -44,23 +47,61 @@ def doGit(cmdList, git_dir):
     gitcmd.insert(0, 'git')
     return subprocess.run(gitcmd, stdout=subprocess.PIPE, cwd=git_dir, universal_newlines=True)
 
+# the files of a project that the analysis reads, keyed as in commit['contents']
+snapshotFiles = {'Screen1/blocks': 'Screen1/blocks.xml',
+                 'Screen1/form': 'Screen1/form.json'}
+
 # returns a list of commit objects (just some dictionaries), in order,
 # with oldest first, given a git directory.
-def listCommits(git_dir):
+# Reads history from master without checking anything out, so the working
+# tree is left alone and several analyses can share one repo.
+# With since (a commit hash), only commits after that one are listed.
+# Each commit also gets the blob ids of its snapshot files in commit['blobs'],
+# collected from the same git log call (--raw), so unchanged files can be
+# recognized without reading them.
+def listCommits(git_dir, since=None):
     "Returns a list of commits from a given git directory."
-    checkoutCommit(git_dir, 'master')
-    result = doGit(['log', '--reverse', '--format="%H,%ct,%cI"'], git_dir)
+    if activeArchive is not None and git_dir in activeArchive:
+        return activeArchive.listCommits(git_dir, since)
+    revs = 'master' if since is None else since + '..master'
+    with instrument.stage('git log'):
+        result = doGit(['log', '--reverse', '--format="%H,%ct,%cI"', '--raw', '--no-abbrev', revs], git_dir)
     if result.returncode == 0:
         list_of_commits = []
+        blobs = {key: None for key in snapshotFiles}
+        if since is not None:
+            blobs.update(listBlobsAt(since, git_dir))
+        keyOfPath = {path: key for (key, path) in snapshotFiles.items()}
         for commit_line in result.stdout.splitlines():
-            lines = commit_line.split(',')
-            list_of_commits.append(makeCommit(lines[0].strip('"'), lines[1], lines[2].strip('"'), git_dir))
+            if commit_line.startswith(':'):
+                # :oldmode newmode oldblob newblob status<TAB>path
+                meta, path = commit_line.split('\t', 1)
+                if path in keyOfPath:
+                    newblob = meta.split()[3]
+                    blobs[keyOfPath[path]] = None if newblob.strip('0') == '' else newblob
+                    list_of_commits[-1]['blobs'] = blobs.copy()
+            elif commit_line:
+                lines = commit_line.split(',')
+                list_of_commits.append(makeCommit(lines[0].strip('"'), lines[1], lines[2].strip('"'), git_dir))
+                list_of_commits[-1]['blobs'] = blobs.copy()
         return list_of_commits
     else:
         print("Error from git subprocess in listCommits: ", result.returncode)
         return result.returncode
 
+def listBlobsAt(commit_hash, git_dir):
+    "Returns the blob ids of the snapshot files in one commit, keyed as in commit['contents']."
+    result = doGit(['ls-tree', commit_hash] + list(snapshotFiles.values()), git_dir)
+    keyOfPath = {path: key for (key, path) in snapshotFiles.items()}
+    blobs = {}
+    for line in result.stdout.splitlines():
+        # mode type blob<TAB>path
+        meta, path = line.split('\t', 1)
+        blobs[keyOfPath[path]] = meta.split()[2]
+    return blobs
+
 # check out a certain commit
+# No longer used by the analysis itself (see BlobReader), kept for manual poking.
 def checkoutCommit(git_dir, commit_obj):
     if commit_obj == 'master':
         githash = 'master'
@@ -68,19 +109,94 @@ def checkoutCommit(git_dir, commit_obj):
         githash = commit_obj['hash']
     return doGit(['checkout', githash, '-q'], git_dir)
 
+class BlobReader:
+    """Reads blobs out of one repository through a single long-lived
+    `git cat-file --batch` process, instead of a checkout per commit.
+    Objects are named with anything cat-file accepts, e.g. '<hash>:Screen1/blocks.xml'."""
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.proc = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=git_dir,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, objname):
+        "Returns (blob sha, text) for objname, or (None, None) if git doesn't have it."
+        with instrument.stage('read blobs'):
+            self.proc.stdin.write(objname.encode('utf-8') + b'\n')
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().decode('utf-8').split()
+            if len(header) != 3:
+                # '<objname> missing' or '<objname> ambiguous'
+                return None, None
+            sha, _, size = header
+            data = self.proc.stdout.read(int(size))
+            self.proc.stdout.read(1)    # trailing newline after every object
+            instrument.count('bytes read', len(data))
+            return sha, data.decode('utf-8', errors='replace')
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# one open reader per repository, shared by every commit of that repository
+blob_readers = {}
+
+# A corpus archive (archive.CorpusArchive) that repos in it are read from,
+# instead of from git. None reads everything from git.
+activeArchive = None
+
+def useArchive(filename):
+    "Reads the repos in the archive file from it from now on. None goes back to git."
+    global activeArchive
+    if activeArchive is not None:
+        activeArchive.close()
+    activeArchive = None if filename is None else archive.CorpusArchive(filename)
+
+def getBlobReader(git_dir):
+    "Returns the open BlobReader for git_dir, starting one if needed."
+    if activeArchive is not None and git_dir in activeArchive:
+        return activeArchive
+    reader = blob_readers.get(git_dir)
+    if reader is None:
+        reader = BlobReader(git_dir)
+        blob_readers[git_dir] = reader
+    return reader
+
+def closeBlobReader(git_dir):
+    "Shuts down the reader for git_dir, if there is one."
+    reader = blob_readers.pop(git_dir, None)
+    if reader is not None:
+        reader.close()
+
 # add the blocks and form data for Screen1 to the commit object
-def getFileContentsAt(commit_obj):
-    "Adds the file contents to the commit object."
-    git_dir = commit_obj['dir']
-    checkoutCommit(git_dir, commit_obj)
-    blocksFilePath = os.path.join(git_dir, 'Screen1/blocks.xml')
-    formFilePath = os.path.join(git_dir, 'Screen1/form.json')
+# A file missing from a commit reads as an empty string.
+def getFileContentsAt(commit_obj, reader=None):
+    "Adds the file contents, and the blob ids they came from, to the commit object."
+    if reader is None:
+        reader = getBlobReader(commit_obj['dir'])
     contents = {}
-    with open(blocksFilePath) as afile:
-        contents['Screen1/blocks'] = afile.read()
-    with open(formFilePath) as afile:
-        contents['Screen1/form'] = afile.read()
+    blobs = {}
+    for key, path in snapshotFiles.items():
+        sha, text = reader.read(commit_obj['hash'] + ':' + path)
+        contents[key] = text if text is not None else ''
+        blobs[key] = sha
     commit_obj['contents'] = contents
+    commit_obj['blobs'] = blobs
+
+def readFileAt(commit_obj, key, reader=None):
+    "Returns the text of one snapshot file (a key of snapshotFiles) at a commit."
+    if reader is None:
+        reader = getBlobReader(commit_obj['dir'])
+    _, text = reader.read(commit_obj['hash'] + ':' + snapshotFiles[key])
+    return text if text is not None else ''
 
 # This global variable holds projects that caused problems during doesFileContain
 problem_projects = []
@@ -141,6 +257,53 @@ def filterAllProjectsIn(folder, filterProc):
 
     return value
 
+# Filtering from the object store: form.json is read at master with git cat-file,
+# so results don't depend on whatever an earlier run left checked out, and a
+# thread pool keeps many git processes (and disk reads) in flight at once.
+
+def readFormAt(git_dir, rev='master'):
+    "Returns the text of Screen1/form.json at rev, or None if it can't be read."
+    if activeArchive is not None and git_dir in activeArchive:
+        return activeArchive.readFormAt(git_dir, rev)
+    result = subprocess.run(['git', 'cat-file', 'blob', rev + ':Screen1/form.json'], cwd=git_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+def formContains(string_to_match):
+    "Makes a test on form.json text, for classifyAllProjectsIn."
+    return lambda formText: string_to_match in formText
+
+# one pass of classifyAllProjectsIn sorts repos into all of these at once
+activityTests = {'Debugging': formContains('"AboutScreen":"MSDEBUGACTIVITY"'),
+                 'Temperature': formContains('"AboutScreen":"MSCSPTemperatureActivity"')}
+
+def classifyAllProjectsIn(folder, tests=activityTests, workers=16, rev='master'):
+    '''Runs a batch of tests over the form.json of every project, reading each form once.
+    tests: dict of name -> function taking the form text.
+    Returns dict of name -> list of projects that passed that test, in walk order.'''
+    repos = [os.path.join(user, repo) for user in getAllUsersIn(folder) for repo in getReposFrom(user)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        forms = list(pool.map(lambda repo: readFormAt(repo, rev), repos))
+    value = {name: [] for name in tests}
+    for repo, form in zip(repos, forms):
+        if form is None:
+            problem_projects.append({'attempted': repo + ' ' + rev + ':Screen1/form.json',
+                                     'ls': os.listdir(repo) if os.path.isdir(repo) else []})
+            continue
+        for name, test in tests.items():
+            if test(form):
+                value[name].append(repo)
+    if len(problem_projects) > 0:
+        print(problem_projects)
+        print("The above projects gave errors during classifyAllProjectsIn")
+    return value
+
+def filterAllProjectsAt(folder, test, workers=16, rev='master'):
+    "Like filterAllProjectsIn, with test taking form.json text read from the object store."
+    return classifyAllProjectsIn(folder, {'match': test}, workers, rev)['match']
+
 def printList(data):
     for i in data:
         print(i)
@@ -151,6 +314,7 @@ def printList(data):
 if __name__ == '__main__':
     # identify repos to analyze
     # repos = filterAllProjectsIn('userFiles', isTemperatureActivity)
+    # activities = classifyAllProjectsIn('userFiles')
     #printList(repos)
     #writeFileLines('temperatureProjects', repos)
 
@@ -159,6 +323,7 @@ if __name__ == '__main__':
     #printList(commits)
     for commit in commits:
         getFileContentsAt(commit)
+    closeBlobReader(testproject)
     print("----------------AND THEN--------------------")
     print(commits[0]['contents']['Screen1/blocks'])
 
@@ -0,0 +1,161 @@
+"Opt-in per-stage timers and counters for processProject and processCorpus."
+# Off by default. Code marks its stages and counts things with
+#   with instrument.stage('parse'):
+#       ...
+#   instrument.count('bytes read', len(data))
+# and when instrumentation is off, stage() hands back a shared do-nothing
+# context manager and count() returns at once, so the hooks cost next to
+# nothing. Turned on, every stage gets wall time, CPU time and a call count.
+#   instrument.enable()
+#   changes = main.processCorpus(projects)
+#   instrument.report.printSummary()
+#   instrument.report.save('timings.json')
+# Stats are kept per project (main.iterProject starts and ends one) and added
+# up into a corpus total; processCorpus brings worker processes' stats home.
+# Stages outside any project (e.g. exports) go straight into the total.
+import json
+import time
+
+enabled = False
+# the Stats of the project being processed, and the Report of the run
+current = None
+report = None
+
+class Stats:
+    "Wall and CPU seconds and calls per stage, and counters, of one project or more."
+
+    def __init__(self):
+        self.stages = {}        # name -> [wall, cpu, calls]
+        self.counters = {}
+
+    def add(self, name, wall, cpu):
+        s = self.stages.get(name)
+        if s is None:
+            self.stages[name] = [wall, cpu, 1]
+        else:
+            s[0] = s[0] + wall
+            s[1] = s[1] + cpu
+            s[2] = s[2] + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        for name, (wall, cpu, calls) in other.stages.items():
+            s = self.stages.setdefault(name, [0.0, 0.0, 0])
+            s[0] = s[0] + wall
+            s[1] = s[1] + cpu
+            s[2] = s[2] + calls
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def toDict(self):
+        return {'stages': {name: {'wall': wall, 'cpu': cpu, 'calls': calls}
+                           for name, (wall, cpu, calls) in self.stages.items()},
+                'counters': dict(self.counters)}
+
+    @classmethod
+    def fromDict(cls, d):
+        stats = cls()
+        stats.stages = {name: [s['wall'], s['cpu'], s['calls']] for name, s in d['stages'].items()}
+        stats.counters = dict(d['counters'])
+        return stats
+
+class Report:
+    "Stats per project and their total, for one run."
+
+    def __init__(self):
+        self.projects = {}
+        self.total = Stats()
+
+    def addProject(self, projFolder, stats):
+        if projFolder in self.projects:
+            self.projects[projFolder].merge(stats)
+        else:
+            self.projects[projFolder] = stats
+        self.total.merge(stats)
+
+    def toDict(self):
+        return {'total': self.total.toDict(),
+                'projects': {p: s.toDict() for p, s in self.projects.items()}}
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.toDict(), f, indent=1)
+
+    def printSummary(self, stats=None):
+        "Prints the stages, slowest first, and the counters of stats (default: the total)."
+        stats = stats or self.total
+        totalWall = sum(s[0] for s in stats.stages.values()) or 1
+        print('%-28s %10s %10s %10s %6s' % ('stage (%d projects)' % len(self.projects), 'wall s', 'cpu s', 'calls', 'wall%'))
+        for name, (wall, cpu, calls) in sorted(stats.stages.items(), key=lambda s: -s[1][0]):
+            print('%-28s %10.3f %10.3f %10d %5.1f%%' % (name, wall, cpu, calls, 100 * wall / totalWall))
+        for name, n in sorted(stats.counters.items()):
+            print('%-28s %10d' % (name, n))
+
+class Stage:
+    "Times one run of a stage into the current Stats."
+    __slots__ = ['name', 'wall', 'cpu']
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        current.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+        return False
+
+class NoStage:
+    "What stage() returns when instrumentation is off."
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+noStage = NoStage()
+
+def stage(name):
+    "Context manager timing the stage name, when instrumentation is on."
+    if not enabled:
+        return noStage
+    return Stage(name)
+
+def count(name, n=1):
+    "Adds n to the counter name, when instrumentation is on."
+    if enabled:
+        current.count(name, n)
+
+def enable():
+    "Turns instrumentation on, with a fresh report."
+    global enabled, current, report
+    enabled = True
+    report = Report()
+    current = report.total
+
+def disable():
+    "Turns instrumentation off. The report of the run is kept."
+    global enabled
+    enabled = False
+
+def startProject():
+    "Starts collecting the stats of a new project."
+    global current
+    if enabled:
+        current = Stats()
+
+def endProject(projFolder):
+    "Files the current stats under projFolder and returns them (None when off)."
+    global current
+    if not enabled:
+        return None
+    stats = current
+    report.addProject(projFolder, stats)
+    current = report.total
+    return stats
@@ -0,0 +1,163 @@
+"Per-project block lifetime index, built in one pass over a processed history."
+# For every block id: the commits where it was added, deleted, moved on the
+# workspace, re-parented (moved in context), changed or had its fields edited,
+# and from those its presence intervals. This answers what
+# xml_analyze.whichMapsisBlockPresent does, without keeping an IDmap per commit
+# and scanning them all.
+#   index = LifetimeIndex.fromChanges(processProject(p))
+#   index.intervals('12')          [(0, 40), (52, None)]: present in commits 0-39 and 52-end
+#   index.blame('12')              (52, 'fields'): the last commit that touched block 12
+#   index.longestLived(10)         the 10 blocks present for the most commits
+#   index.save('proj.lifetime.json')
+# Commits are numbered by their position in the processed list of changes.
+import json
+import featureNames as names
+import blockparser
+
+kinds = ['added', 'deleted', 'moved', 'reparented', 'changed', 'fields']
+# the features list behind each kind of event, after additions and deletions
+featureLists = [('moved', names.blocksMovedInSpaceList),
+                ('reparented', names.blocksMovedContextList),
+                ('changed', names.blocksChangedList),
+                ('fields', names.blocksFieldsChangedList)]
+
+def snapshotIDs(commit):
+    "Block ids of a commit's snapshot, from its table or else by parsing its contents."
+    if 'table' in commit:
+        return commit['table'].ids
+    if 'contents' in commit:
+        blocksXML = commit['contents']['Screen1/blocks']
+        try:
+            return blockparser.parseTable(blocksXML).ids if blocksXML else []
+        except blockparser.parseErrors:
+            return []
+    raise ValueError('commit ' + commit['hash'] + ' has neither features, a block table nor contents')
+
+class LifetimeIndex:
+    "Events of every block in one project's history, see the module comment."
+
+    def __init__(self):
+        self.hashes = []        # per commit
+        self.seconds = []       # per commit: seconds_elapsed
+        self.events = {}        # block id -> [(commit, kind)] in commit order
+        self.present = set()    # ids present after the last commit added
+
+    @classmethod
+    def fromChanges(cls, changes):
+        "Index of a project's processed commits (any iterable, e.g. main.iterProject)."
+        index = cls()
+        for c in changes:
+            index.addCommit(c)
+        return index
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def record(self, blockID, k, kind):
+        self.events.setdefault(blockID, []).append((k, kind))
+
+    def addCommit(self, commit):
+        '''Adds the next commit of the history. A commit with features is read from
+        them; one without (the first) is compared to the blocks present so far.'''
+        k = len(self.hashes)
+        self.hashes.append(commit['hash'])
+        self.seconds.append(commit.get('seconds_elapsed', 0))
+        feat = commit.get(names.featureExtractionResults)
+        if feat is None:
+            ids = set(snapshotIDs(commit))
+            deleted = sorted(self.present - ids)
+            added = sorted(ids - self.present)
+            feat = {}
+        else:
+            deleted = feat.get(names.blocksDeletedList, [])
+            added = feat.get(names.blocksAddedList, [])
+        for i in deleted:
+            self.record(i, k, 'deleted')
+            self.present.discard(i)
+        for i in added:
+            self.record(i, k, 'added')
+            self.present.add(i)
+        for kind, listName in featureLists:
+            for i in feat.get(listName, []):
+                self.record(i, k, kind)
+
+    def blocks(self):
+        "Every block id that was ever present."
+        return list(self.events)
+
+    def commitsOf(self, blockID, kind):
+        "Commits with the given kind of event on the block."
+        return [k for (k, e) in self.events.get(blockID, []) if e == kind]
+
+    def intervals(self, blockID):
+        '''Presence intervals of a block as (first commit, commit it was deleted in),
+        the end None while it is still present.'''
+        result = []
+        start = None
+        for k, kind in self.events.get(blockID, []):
+            if kind == 'added' and start is None:
+                start = k
+            elif kind == 'deleted' and start is not None:
+                result.append((start, k))
+                start = None
+        if start is not None:
+            result.append((start, None))
+        return result
+
+    def presentAt(self, blockID, k):
+        "Was the block in the snapshot of commit k?"
+        return any(start <= k and (end is None or k < end) for (start, end) in self.intervals(blockID))
+
+    def firstAppearance(self, blockID):
+        "Commit the block first appeared in, None if it never did."
+        added = self.commitsOf(blockID, 'added')
+        return added[0] if added else None
+
+    def blame(self, blockID, at=None):
+        "(commit, kind) of the last event on the block up to commit at (default: the end), or None."
+        last = None
+        for k, kind in self.events.get(blockID, []):
+            if at is not None and k > at:
+                break
+            last = (k, kind)
+        return last
+
+    def lifetime(self, blockID, seconds=False):
+        "Number of commits (or seconds, by seconds_elapsed) the block was present for."
+        total = 0
+        for start, end in self.intervals(blockID):
+            if seconds:
+                total = total + self.seconds[len(self) - 1 if end is None else end] - self.seconds[start]
+            else:
+                total = total + (len(self) if end is None else end) - start
+        return total
+
+    def longestLived(self, n=10, seconds=False):
+        "The n blocks present the longest, as (block id, lifetime), longest first."
+        lives = [(i, self.lifetime(i, seconds)) for i in self.events]
+        lives.sort(key=lambda l: -l[1])
+        return lives[:n]
+
+    def toDict(self):
+        code = {kind: n for (n, kind) in enumerate(kinds)}
+        return {'kinds': kinds, 'hashes': self.hashes, 'seconds': self.seconds,
+                'events': {i: [[k, code[kind]] for (k, kind) in ev] for (i, ev) in self.events.items()},
+                'present': sorted(self.present)}
+
+    @classmethod
+    def fromDict(cls, d):
+        index = cls()
+        index.hashes = d['hashes']
+        index.seconds = d['seconds']
+        index.events = {i: [(k, d['kinds'][kind]) for (k, kind) in ev] for (i, ev) in d['events'].items()}
+        index.present = set(d['present'])
+        return index
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.toDict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls.fromDict(json.load(f))
@@ -0,0 +1,115 @@
+"Fast line diff (Myers' algorithm on hashed lines) with difflib.Differ's output format."
+# difflib.Differ matches lines with SequenceMatcher, then looks for similar line
+# pairs inside every replaced region to print '?' intra-line hints. That is
+# super-linear, and the blocks XML diffs only need the '- ', '+ ' and '  ' lines.
+# Myers' algorithm takes O((N + M) * D) time for D changed lines, and snapshots
+# usually differ by a handful of lines.
+
+# Past this many edits the diff stops being minimal: the rest of the region is
+# reported as a single replacement, which is still a correct diff.
+maxEdits = 2000
+
+def opcodes(a, b):
+    '''Returns the edit script turning list a into list b, as SequenceMatcher.get_opcodes
+    does: (tag, i1, i2, j1, j2) tuples, tag one of 'equal', 'delete', 'insert', 'replace'.'''
+    # trim the common prefix and suffix, usually almost all of the file
+    n, m = len(a), len(b)
+    pre = 0
+    while pre < n and pre < m and a[pre] == b[pre]:
+        pre = pre + 1
+    suf = 0
+    while suf < n - pre and suf < m - pre and a[n - 1 - suf] == b[m - 1 - suf]:
+        suf = suf + 1
+    # intern lines as ints so comparisons in the inner loop are cheap
+    ids = {}
+    x = [ids.setdefault(line, len(ids)) for line in a[pre:n - suf]]
+    y = [ids.setdefault(line, len(ids)) for line in b[pre:m - suf]]
+
+    codes = []
+    if pre:
+        codes.append(('equal', 0, pre, 0, pre))
+    for (tag, i1, i2, j1, j2) in middleOpcodes(x, y):
+        codes.append((tag, i1 + pre, i2 + pre, j1 + pre, j2 + pre))
+    if suf:
+        codes.append(('equal', n - suf, n, m - suf, m))
+    return codes
+
+def middleOpcodes(x, y):
+    "Myers' greedy shortest edit script between int lists x and y, as opcodes."
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        if n or m:
+            return [('delete' if n else 'insert', 0, n, 0, m)]
+        return []
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+    trace = []
+    found = False
+    for d in range(min(n + m, maxEdits) + 1):
+        # only diagonals -d-1 .. d+1 are read back for this d: keep that window
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                i = v[offset + k + 1]           # step down: insert from y
+            else:
+                i = v[offset + k - 1] + 1       # step right: delete from x
+            j = i - k
+            while i < n and j < m and x[i] == y[j]:
+                i = i + 1
+                j = j + 1
+            v[offset + k] = i
+            if i >= n and j >= m:
+                found = True
+                break
+        if found:
+            break
+    if not found:
+        return [('replace', 0, n, 0, m)]
+
+    # walk the trace backwards, collecting the matched diagonal runs
+    matches = []
+    i, j = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        vd = trace[d]
+        base = d + 1        # index of diagonal 0 in the window
+        k = i - j
+        if k == -d or (k != d and vd[base + k - 1] < vd[base + k + 1]):
+            prevK = k + 1
+        else:
+            prevK = k - 1
+        prevI = vd[base + prevK]
+        prevJ = prevI - prevK
+        # the snake from (after the edit) up to (i, j) is a run of equal lines
+        startI = prevI if prevK == k + 1 else prevI + 1
+        startJ = startI - k
+        if i > startI:
+            matches.append((startI, startJ, i - startI))
+        i, j = prevI, prevJ
+    if i > 0:
+        matches.append((0, 0, i))
+    matches.reverse()
+
+    codes = []
+    i = j = 0
+    for (mi, mj, size) in matches + [(n, m, 0)]:
+        if i < mi and j < mj:
+            codes.append(('replace', i, mi, j, mj))
+        elif i < mi:
+            codes.append(('delete', i, mi, j, mj))
+        elif j < mj:
+            codes.append(('insert', i, mi, j, mj))
+        if size:
+            codes.append(('equal', mi, mi + size, mj, mj + size))
+        i, j = mi + size, mj + size
+    return codes
+
+def compare(a, b):
+    "Like difflib.Differ().compare(a, b), without the '?' hint lines: replaced lines come out as all '- ' then all '+ '."
+    result = []
+    for (tag, i1, i2, j1, j2) in opcodes(a, b):
+        if tag == 'equal':
+            result.extend('  ' + line for line in a[i1:i2])
+        else:
+            result.extend('- ' + line for line in a[i1:i2])
+            result.extend('+ ' + line for line in b[j1:j2])
+    return result
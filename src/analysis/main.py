@@ -1,20 +1,65 @@
 import xml_analyze as xml
 import gitfilter as git
 import featureNames as names
+import snapcache
+import blocktable
+import blockparser
+import instrument
+import resultstore
+import lifetime
 import csv
 import pickle
 import json
+import os
+import time
+import traceback
+import concurrent.futures
 
 # For description of extractable features and tests, see featureNames.py
 def extractChanges(prevChange, curChange):
     '''Extract features of the current changes relative to its predecessor change.
-    prev|curChange must be commit objects with etree, IDmap, and parentmap fields.
-    Result: adds result data to the commit object curChange.'''
+    prev|curChange must be commit objects with etree, IDmap, and parentmap fields (or a table).
+    Result: adds result data, and a lazy blocks diff, to the commit object curChange.
+    Features are reused from the snapshot cache when it is enabled.'''
+
+    curChange['diff'] = xml.LazyDiff(prevChange['contents']['Screen1/blocks'], curChange['contents']['Screen1/blocks'])
+
+    cache = snapcache.activeCache
+    prevSHA = snapcache.blocksSHA(prevChange)
+    curSHA = snapcache.blocksSHA(curChange)
+    if cache is not None and prevSHA and curSHA:
+        features = cache.getChanges(prevSHA, curSHA)
+        if features is None:
+            features = detectChanges(prevChange, curChange)
+            cache.putChanges(prevSHA, curSHA, features)
+    else:
+        features = detectChanges(prevChange, curChange)
+
+    curChange[names.featureExtractionResults] = features
+
+def detectChanges(prevChange, curChange):
+    '''Runs every detector on a pair of commits, returning the features dict.
+    Uses the fused block table detector when both commits have a table, else the etree maps.'''
     features = {}
 
-    curChange['diff'] = xml.getBlocksDiff(prevChange, curChange)
+    if 'table' in prevChange and 'table' in curChange:
+        # all detectors fused into a single pass over the block ids
+        with instrument.stage('detectChanges (table)'):
+            deleted, added, moved, context, changed, fields = \
+                blocktable.detectChanges(prevChange['table'], curChange['table'])
+        da = (deleted, added)
+    else:
+        with instrument.stage('checkForDeletedAddedBlocks'):
+            da = xml.checkForDeletedAddedBlocks(prevChange['etree'], curChange['etree'])
+        with instrument.stage('checkForMovedBlocks'):
+            moved = xml.checkForMovedBlocks(prevChange['IDmap'], curChange['IDmap'])
+        with instrument.stage('checkForContextMove'):
+            context = xml.checkForContextMove(prevChange['IDmap'], curChange['IDmap'], prevChange['parentmap'], curChange['parentmap'])
+        with instrument.stage('checkForChangedBlocks'):
+            changed = xml.checkForChangedBlocks(prevChange['IDmap'], curChange['IDmap'])
+        with instrument.stage('checkForFieldChanges'):
+            fields = xml.checkForFieldChanges(prevChange['IDmap'], curChange['IDmap'])
 
-    da = xml.checkForDeletedAddedBlocks(prevChange['etree'], curChange['etree'])
     if len(da[0]) == 0:
         features[names.blocksDeletedFlag] = False
     else:
@@ -26,35 +71,31 @@ def extractChanges(prevChange, curChange):
         features[names.blocksAddedFlag] = True
         features[names.blocksAddedList] = da[1]
 
-    moved = xml.checkForMovedBlocks(prevChange['IDmap'], curChange['IDmap'])
     if len(moved) == 0:
         features[names.blocksMovedInSpaceFlag] = False
     else:
         features[names.blocksMovedInSpaceFlag] = True
         features[names.blocksMovedInSpaceList] = moved
 
-    context = xml.checkForContextMove(prevChange['IDmap'], curChange['IDmap'], prevChange['parentmap'], curChange['parentmap'])
     if len(context) == 0:
         features[names.blocksMovedContextFlag] = False
     else:
         features[names.blocksMovedContextFlag] = True
         features[names.blocksMovedContextList] = context
 
-    changed = xml.checkForChangedBlocks(prevChange['IDmap'], curChange['IDmap'])
     if len(changed) == 0:
         features[names.blocksChangedFlag] = False
     else:
         features[names.blocksChangedFlag] = True
         features[names.blocksChangedList] = changed
 
-    fields = xml.checkForFieldChanges(prevChange['IDmap'], curChange['IDmap'])
     if len(fields) == 0:
         features[names.blocksFieldsChangedFlag] = False
     else:
         features[names.blocksFieldsChangedFlag] = True
         features[names.blocksFieldsChangedList] = fields
 
-    curChange[names.featureExtractionResults] = features
+    return features
 
 def intersect(list1, list2):
     return list(set(list1) & set(list2))
@@ -108,28 +149,297 @@ def reduceFieldChanges(changes):
     for c in changesToDelete:
         changes.remove(c)
 
+# feature lists whose blocks end a run of field edits in coalesceFieldChanges
+nonFieldLists = [names.blocksDeletedList, names.blocksAddedList,
+                 names.blocksMovedInSpaceList, names.blocksMovedContextList,
+                 names.blocksChangedList]
+
+def isFieldOnlyChange(features):
+    "True if the only thing a commit did was change fields."
+    return features[names.blocksFieldsChangedFlag] and not any(
+        features[flag] for flag in names.allFlags if flag != names.blocksFieldsChangedFlag)
+
+def coalesceFieldChanges(changes, window=None):
+    '''Reduces char-by-char field changes to their final state, in one pass.
+    Tracks runs of field edits per block id, so commits that change several
+    fields at once are handled (unlike reduceFieldChanges). A commit is dropped
+    when it only changed fields, and each block whose fields it changed had them
+    changed again later in the same run. A block's run ends when it is added,
+    deleted, moved or changed otherwise, or, if window (seconds) is given, when
+    its next field edit comes more than window seconds after the previous one.
+    Returns a new list; changes is not modified.'''
+    keep = [True] * len(changes)
+    outstanding = [0] * len(changes)    # blocks of commit n not edited again yet
+    fieldOnly = [False] * len(changes)
+    lastEdit = {}                       # block id -> (commit index, time) of its last field edit
+    for n, c in enumerate(changes):
+        feat = c.get(names.featureExtractionResults)
+        if not feat:
+            continue
+        t = c.get('seconds_elapsed', int(c['date_unix']))
+        for name in nonFieldLists:
+            for b in feat.get(name, ()):
+                lastEdit.pop(b, None)
+        edited = set(feat.get(names.blocksFieldsChangedList, ()))
+        for b in edited:
+            prev = lastEdit.get(b)
+            if prev is not None and (window is None or t - prev[1] <= window):
+                i = prev[0]
+                outstanding[i] = outstanding[i] - 1
+                if outstanding[i] == 0 and fieldOnly[i]:
+                    keep[i] = False
+            lastEdit[b] = (n, t)
+        outstanding[n] = len(edited)
+        fieldOnly[n] = isFieldOnlyChange(feat)
+    return [c for (c, k) in zip(changes, keep) if k]
+
+# fields of a commit object that are only needed while features are extracted
+heavyFields = xml.parsedFields
+
+def shedHeavyFields(commit, keepContents=True):
+    "Removes parsed trees and maps (and contents, unless keepContents) from a commit, in place."
+    for k in heavyFields:
+        commit.pop(k, None)
+    if not keepContents:
+        # the lazy diff holds on to the blocks texts too
+        commit.pop('contents', None)
+        commit.pop('diff', None)
+    return commit
+
+def drain(changes):
+    "Yields the items of a list oldest first, removing each from the list as it goes."
+    changes.reverse()
+    while changes:
+        yield changes.pop()
+
+def blocksUnchanged(prevChange, curChange):
+    "True if both commits are known to have the same Screen1/blocks.xml blob."
+    sha = snapcache.blocksSHA(curChange)
+    return sha is not None and sha == snapcache.blocksSHA(prevChange)
+
+def noChangeFeatures():
+    "The features dict of a commit whose blocks did not change."
+    return {flag: False for flag in names.allFlags}
+
+def countUnchangedBlocks(changes):
+    "Number of commits that were short-circuited because their blocks did not change."
+    return sum(1 for c in changes if c.get('unchangedBlocks'))
+
+def iterChanges(changes, user, start_time, prev=None, keepContents=True):
+    '''Loads commits and extracts their features one at a time.
+    Each commit is yielded, without its heavy fields, as soon as its successor
+    has been compared with it, so at most two parsed snapshots are held.
+    prev: an already loaded commit that precedes the first one, it is not yielded.
+    Commits with empty blocks are skipped (corruption mitigation).
+    Commits whose blocks blob is the same as the previous one's get an all-False
+    features record without being loaded, and are marked 'unchangedBlocks'.'''
+    pending = None
+    for c in changes:
+        instrument.count('commits')
+        if prev is not None and blocksUnchanged(prev, c):
+            # same blocks blob: nothing to read, parse or compare
+            xml.loadUnchangedContents(c, prev, user, start_time)
+            c['diff'] = xml.LazyDiff(prev['contents']['Screen1/blocks'], c['contents']['Screen1/blocks'])
+            c[names.featureExtractionResults] = noChangeFeatures()
+            c['unchangedBlocks'] = True
+            instrument.count('unchanged blocks')
+        elif xml.loadChangeContents(c, user, start_time):
+            print('\nRemoved due to empty blocks file:\n' + user + ' ' + str(c))
+            continue
+        elif prev is not None:
+            extractChanges(prev, c)
+        if pending is not None:
+            yield shedHeavyFields(pending, keepContents)
+        prev = pending = c
+    if pending is not None:
+        yield shedHeavyFields(pending, keepContents)
+
+def iterProject(projFolder, keepContents=True):
+    "Extracts features from all commits of a project, yielding commits one by one."
+    instrument.startProject()
+    try:
+        changes = git.listCommits(projFolder)
+        user = projFolder.split('/')[-2]
+        start_time = int(changes[0]['date_unix'])
+        yield from iterChanges(drain(changes), user, start_time, keepContents=keepContents)
+    finally:
+        git.closeBlobReader(projFolder)
+        instrument.endProject(projFolder)
+
 def processProject(projFolder):
     "Extracts features from all commits of a project."
-    changes = git.listCommits(projFolder)
-    user = projFolder.split('/')[-2]
-    start_time = int(changes[0]['date_unix'])
-    # run through all commit objects, loading their contents into them
-    changesToDelete = []
-    for c in changes:
-        if xml.loadChangeContents(c, user, start_time):
-            changesToDelete.append(c)
-    # remove commits that had empty blocks (corruption mitigation)
-    for c in changesToDelete:
-        changes.remove(c)
-        print('\nRemoved due to empty blocks file:\n' + user + ' ' + str(c))
-    # run the extractor
-    for prev, cur in zip(changes[:-1], changes[1:]):
-        extractChanges(prev, cur)
+    changes = list(iterProject(projFolder))
     # reduce text field changes to their final state
     #reduceFieldChanges(changes)
 
     return changes
 
+# Incremental analysis keeps a high-water mark per repo in this folder:
+# the last analyzed commit hash, the project start time and the last snapshot.
+incrementalStateFolder = 'incremental'
+
+def incrementalStatePath(projFolder, stateFolder):
+    user, project = projFolder.rstrip('/').split('/')[-2:]
+    return os.path.join(stateFolder, user, project + '.pickle')
+
+def processProjectIncremental(projFolder, changes=None, stateFolder=incrementalStateFolder):
+    '''Extracts features only from commits added since the last run on this project.
+    The first new commit is compared against the snapshot saved by the last run.
+    New commits are appended to changes (the results of earlier runs), which is returned.
+    Without saved state, this processes the whole history and saves the state.'''
+    if changes is None:
+        changes = []
+    user = projFolder.split('/')[-2]
+    statePath = incrementalStatePath(projFolder, stateFolder)
+    state = None
+    if os.path.isfile(statePath):
+        with open(statePath, 'rb') as f:
+            state = pickle.load(f)
+
+    if state is None:
+        new = git.listCommits(projFolder)
+        if not new:
+            return changes
+        start_time = int(new[0]['date_unix'])
+        prev = None
+    else:
+        new = git.listCommits(projFolder, since=state['head'])
+        if not new:
+            return changes
+        start_time = state['start_time']
+        prev = state['last']
+        prev.update(xml.parseSnapshot(prev, user))
+    head = new[-1]['hash']
+
+    try:
+        new = list(iterChanges(new, user, start_time, prev))
+    finally:
+        git.closeBlobReader(projFolder)
+    if new:
+        last = new[-1]
+    else:
+        last = state['last']    # every new commit had empty blocks
+    os.makedirs(os.path.dirname(statePath), exist_ok=True)
+    with open(statePath, 'wb') as f:
+        pickle.dump({'head': head, 'start_time': start_time,
+                     'last': {k: v for (k, v) in last.items() if k in snapshotStateFields}}, f)
+
+    changes.extend(new)
+    return changes
+
+# the parts of a commit saved as the last snapshot of an incremental run
+snapshotStateFields = ['hash', 'date_unix', 'date', 'dir', 'contents', 'blobs', 'username', 'seconds_elapsed']
+
+def processProjectLean(projFolder, keepContents=True):
+    "processProject, optionally without contents, for results that cross process boundaries."
+    return list(iterProject(projFolder, keepContents))
+
+# This global variable holds projects that raised an exception during processCorpus
+failed_projects = []
+
+def processProjectSafely(projFolder, keepContents=True, instrumented=False):
+    '''Returns (lean commits, None, stats), or ([], traceback text, stats) if the project failed.
+    instrumented: for worker processes. Collect the project's instrument.Stats
+    into a fresh report and return them, else stats is None.'''
+    if instrumented:
+        # a forked worker starts with a copy of the parent's report, and a
+        # worker runs many projects: only this project's stats go home
+        instrument.enable()
+    try:
+        changes, error = processProjectLean(projFolder, keepContents), None
+    except Exception:
+        changes, error = [], traceback.format_exc()
+    stats = instrument.report.total if instrumented else None
+    return changes, error, stats
+
+def printProgress(done, total, commits, unchanged, started):
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed > 0 else 0
+    print('%d/%d projects, %d commits (%d with unchanged blocks), %.1f projects/s, %.0f commits/s, %ds elapsed'
+          % (done, total, commits, unchanged, rate, commits / elapsed if elapsed > 0 else 0, elapsed))
+
+def initWorker(archiveFile, cacheFolder, cacheMaxBytes, backend, instrumented):
+    '''Runs in each processCorpus worker when it starts. Under the spawn start
+    method (macOS, Windows) a worker imports everything afresh, so the parent's
+    settings are set up again here.'''
+    git.useArchive(archiveFile)
+    blockparser.setBackend(backend)
+    if cacheFolder is not None:
+        snapcache.enableCache(cacheFolder, cacheMaxBytes)
+    if instrumented:
+        instrument.enable()
+
+def processCorpus(projects, workers=None, keepContents=True, reportEvery=10, store=None):
+    '''Runs processProject over many projects using a pool of worker processes.
+    Returns a list with one list of lean commits per project, in the order of projects.
+    A project that fails gets an empty list and is added to failed_projects.
+    workers: number of processes, default is one per CPU. 1 runs everything in this process.
+    reportEvery: print a progress line after this many projects finish.
+    store: a resultstore.ResultStore. Projects already in it are skipped, and each
+    project is saved to it (with its lifetime index, if keepContents) as soon as it
+    finishes, instead of being held in memory. Returns store.lazy() over the
+    projects that are in the store, so a failed project is left out.
+    With instrument enabled, the workers' per-project stats are added to instrument.report.'''
+    results = [None] * len(projects)
+    firstFailure = len(failed_projects)
+    todo = list(range(len(projects)))
+    if store is not None:
+        todo = [i for i in todo if projects[i] not in store]
+        if len(todo) < len(projects):
+            print('%d of %d projects are already in %s' % (len(projects) - len(todo), len(projects), store.folder))
+    done = 0
+    commits = 0
+    unchanged = 0
+    started = time.time()
+
+    def collect(i, result):
+        nonlocal done, commits, unchanged
+        changes, error, stats = result
+        if stats is not None:
+            instrument.report.addProject(projects[i], stats)
+        if error is not None:
+            failed_projects.append({'project': projects[i], 'error': error})
+        elif store is not None:
+            index = lifetime.LifetimeIndex.fromChanges(changes) if keepContents and changes else None
+            store.put(projects[i], changes, index)
+        else:
+            results[i] = changes
+        done = done + 1
+        commits = commits + len(changes)
+        unchanged = unchanged + countUnchangedBlocks(changes)
+        if reportEvery and done % reportEvery == 0:
+            printProgress(done, len(todo), commits, unchanged, started)
+
+    if workers == 1:
+        for i in todo:
+            # stats go straight into instrument.report in this process
+            collect(i, processProjectSafely(projects[i], keepContents))
+    else:
+        # workers use the same corpus archive and snapshot cache, if any, and parser backend
+        archiveFile = git.activeArchive.filename if git.activeArchive is not None else None
+        cache = snapcache.activeCache
+        initargs = (archiveFile, cache.folder if cache is not None else None,
+                    cache.maxBytes if cache is not None else None, blockparser.backend, instrument.enabled)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                                    initargs=initargs) as pool:
+            futures = {pool.submit(processProjectSafely, projects[i], keepContents, instrument.enabled): i
+                       for i in todo}
+            for f in concurrent.futures.as_completed(futures):
+                collect(futures[f], f.result())
+
+    if not reportEvery or done % reportEvery != 0:
+        printProgress(done, len(todo), commits, unchanged, started)
+    if len(failed_projects) > firstFailure:
+        for f in failed_projects[firstFailure:]:
+            print(f['project'] + '\n' + f['error'])
+        print("The above projects failed during processCorpus")
+    if store is not None:
+        return store.lazy([p for p in projects if p in store])
+    for i in range(len(projects)):
+        if results[i] is None:
+            results[i] = []     # failed
+    return results
+
 def countChangeFlags(changes, flag):
     count = 0
     for change in changes:
@@ -147,12 +457,9 @@ def countAllChangeFlags(changes):
 
 def combineLines(textList):
     'Takes a list of strings and concatenates them as lines in a single text.'
-    bulk = ''
-    for l in textList:
-        bulk = bulk + l + '\n'
-    return bulk
+    return ''.join(l + '\n' for l in textList)
 
-def constructPrint(commit):
+def constructPrint(commit, diff=True, fastDiff=False):
     "Constructs a dictionary of data to be printed to file"
     c = {}
     if 'features' in commit:
@@ -161,12 +468,19 @@ def constructPrint(commit):
     c['seconds_elapsed'] = commit['seconds_elapsed']
     c['hash'] = commit['hash']
     c['username'] = commit['username']
-    if 'diff' in commit:
-        c['diff'] = combineLines(commit['diff'])
+    if diff and 'diff' in commit:
+        if isinstance(commit['diff'], xml.LazyDiff):
+            # the diff is only worked out here, when an export asks for it
+            c['diff'] = combineLines(commit['diff'].lines(fastDiff))
+        else:
+            c['diff'] = combineLines(commit['diff'])
     return c
 
-def printCSV(changes, filename, diff=True):
-    "Prints data to a CSV file."
+def printCSV(changes, filename, diff=True, fastDiff=False):
+    '''Prints data to a CSV file.
+    fastDiff: write the diff column with the faster Myers line diff, which has no
+    '?' hint lines and lists a replaced run as all '-' lines then all '+' lines.
+    The default is difflib.Differ's output, as before.'''
     changeList = []
     if diff:
         fieldsToExport = names.exportFieldsDiff
@@ -182,13 +496,15 @@ def printCSV(changes, filename, diff=True):
         writer = csv.DictWriter(csvfile, fieldnames=fieldsToExport)
         writer.writeheader()
         for c in changeList:
-            writer.writerow(constructPrint(c))
+            row = constructPrint(c, diff, fastDiff)
+            with instrument.stage('export'):
+                writer.writerow(row)
 
 def exportJSONforPlayback(changes, filename):
     """Prints a set of changes to a JSON file for import into App Inventor playback."""
     data = [{k: v for (k, v) in c.items() if k in ['seconds_elapsed', 'dir', 'date', 'contents']} for c in changes]
 
-    with open(filename, 'w') as file:
+    with instrument.stage('export'), open(filename, 'w') as file:
         json.dump(data, file)
 
 def saveVar(variable, name):
@@ -201,42 +517,58 @@ def restoreVar(name):
         p = pickle.load(f)
     return p
 ### Start here! ###
-
-#AllDebugProjects = git.filterAllProjectsIn('userFiles', git.isDebuggingActivity)
-AllDebugProjects = restoreVar('AllDebugProjects')
-allp = []
-#allp = [processProject(p) for p in AllDebugProjects]
-
-# How to restore allp quickly:
-allp = restoreVar('allp')
-allp_reduced = restoreVar('allp_reduced')
-
-#AllTemperatureProjects = git.filterAllProjectsIn('userFiles', git.isTemperatureActivity)
-# temperature n = 35! really?
-
-testProjFolder = AllDebugProjects[0]
-testProjFolder2 = '/Users/mark/android/snapshot-service-data/userFiles/CalgaryHyena/CSPathwaysDebuggingActivity#5196459188158464.git'
-# Folder 3 has nearly 30% flagged commits with multiple field changes at the same time. Oy vey.
-testProjFolder3 = '/Users/mark/android/snapshot-service-data/userFiles/VaranasiOstrich/CSPathwaysDebuggingActivity#6214707618775040.git'
-
-#print('processing ' + testProjFolder3)
-#commits = processProject(testProjFolder3)
-#c2 = processProject(AllDebugProjects[1])
-# p = processProject('userFiles/ChongjuOwl/CSPathwaysDebuggingActivity#5652383656837120.git')
-
-# # some test data...
-# # b60 -> b61 text block that doesn't change
-# # b30 -> b31 text block that DOES change
-# # from IDmaps[0|1]['6'|'3']
-# # useful: b10 -> b11 because it has many sub-properties
-# b60 = IDmaps[0]['6']
-# b61 = IDmaps[1]['6']
-# b30 = IDmaps[0]['3']
-# b31 = IDmaps[1]['3']
-# b10 = IDmaps[0]['1']
-# b11 = IDmaps[1]['1']
-# # 29-30 id 6 DELETES
-# b629 = IDmaps[29]['6']
-# # 31-32 ID 3 MOVES
-# b330 = IDmaps[31]['3']
-# b331 = IDmaps[32]['3']
+# Only when run as a script: processCorpus worker processes import this module.
+if __name__ == '__main__':
+
+    #AllDebugProjects = git.filterAllProjectsIn('userFiles', git.isDebuggingActivity)
+    # or, once catalog.buildCatalog('userFiles') has been run:
+    #import catalog
+    #AllDebugProjects = catalog.selectProjects('Debugging')
+    AllDebugProjects = restoreVar('AllDebugProjects')
+    # processed projects are kept per project in a results store (resultstore.py)
+    results = resultstore.ResultStore('results')
+    allp = []
+    #allp = [processProject(p) for p in AllDebugProjects]
+    # saves each project as it finishes; run again after a crash to carry on where it stopped:
+    #allp = processCorpus(AllDebugProjects, store=results)
+    # to read the repos from one corpus archive file (archive.buildArchive) instead of git:
+    #git.useArchive('debugging.snaparc')
+    # to see where the time goes, run the above after instrument.enable(), then
+    #instrument.report.printSummary(); instrument.report.save('timings.json')
+
+    # How to restore allp quickly (each project loads when it is used):
+    finished = [p for p in AllDebugProjects if p in results]
+    allp = results.lazy(finished)
+    allp_reduced = results.lazy(finished, transform=reduceFieldChangesF)
+    # to move an old allp.pickle into the store:
+    #resultstore.importResults(restoreVar('allp'), results)
+
+    #AllTemperatureProjects = git.filterAllProjectsIn('userFiles', git.isTemperatureActivity)
+    # temperature n = 35! really?
+
+    testProjFolder = AllDebugProjects[0]
+    testProjFolder2 = '/Users/mark/android/snapshot-service-data/userFiles/CalgaryHyena/CSPathwaysDebuggingActivity#5196459188158464.git'
+    # Folder 3 has nearly 30% flagged commits with multiple field changes at the same time. Oy vey.
+    testProjFolder3 = '/Users/mark/android/snapshot-service-data/userFiles/VaranasiOstrich/CSPathwaysDebuggingActivity#6214707618775040.git'
+
+    #print('processing ' + testProjFolder3)
+    #commits = processProject(testProjFolder3)
+    #c2 = processProject(AllDebugProjects[1])
+    # p = processProject('userFiles/ChongjuOwl/CSPathwaysDebuggingActivity#5652383656837120.git')
+
+    # # some test data...
+    # # b60 -> b61 text block that doesn't change
+    # # b30 -> b31 text block that DOES change
+    # # from IDmaps[0|1]['6'|'3']
+    # # useful: b10 -> b11 because it has many sub-properties
+    # b60 = IDmaps[0]['6']
+    # b61 = IDmaps[1]['6']
+    # b30 = IDmaps[0]['3']
+    # b31 = IDmaps[1]['3']
+    # b10 = IDmaps[0]['1']
+    # b11 = IDmaps[1]['1']
+    # # 29-30 id 6 DELETES
+    # b629 = IDmaps[29]['6']
+    # # 31-32 ID 3 MOVES
+    # b330 = IDmaps[31]['3']
+    # b331 = IDmaps[32]['3']
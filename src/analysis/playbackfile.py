@@ -0,0 +1,131 @@
+"Keyframe + delta playback files, a compact alternative to main.exportJSONforPlayback."
+# exportJSONforPlayback writes every snapshot in full. Consecutive snapshots
+# differ by a few lines, so here most frames are stored as line deltas against
+# the frame before, with a full keyframe every keyframeInterval frames:
+#
+#   <name>.json         index: frame metadata, frame count, chunk file names
+#   <name>-0000.json    frames 0 .. chunkSize-1
+#   <name>-0001.json    ...
+#
+# Every chunk starts with a keyframe, so chunks load and decode on their own
+# (playback.js fetches them on demand). A chunk is a list of frames, each one of
+#   {"k": {file: full text}}                           keyframe
+#   {"d": {file: [[i1, i2, [lines]], ...]}}            delta
+# where a delta op replaces lines i1..i2 of the previous frame's text (split on
+# '\n') with the given lines. Files missing from a delta did not change.
+import os
+import json
+import linediff
+import instrument
+
+formatName = 'keyframe-delta'
+formatVersion = 1
+playbackFields = ['seconds_elapsed', 'dir', 'date']
+
+def deltaOps(textA, textB):
+    "Line edit ops turning textA into textB."
+    a = textA.split('\n')
+    b = textB.split('\n')
+    return [[i1, i2, b[j1:j2]] for (tag, i1, i2, j1, j2) in linediff.opcodes(a, b) if tag != 'equal']
+
+def applyOps(text, ops):
+    "Applies deltaOps output to text."
+    lines = text.split('\n')
+    # ops are in order and don't overlap: apply from the end so indexes stay valid
+    for (i1, i2, new) in reversed(ops):
+        lines[i1:i2] = new
+    return '\n'.join(lines)
+
+def chunkName(filename, n):
+    base = filename[:-len('.json')] if filename.endswith('.json') else filename
+    return '%s-%04d.json' % (base, n)
+
+def exportPlayback(changes, filename, keyframeInterval=20, chunkSize=200):
+    '''Writes commits with contents (any iterable) as a keyframe + delta playback file.
+    filename is the index file; chunk files are written next to it.'''
+    frames = []
+    chunks = []
+    chunk = []
+    prev = None
+
+    def flush():
+        name = chunkName(filename, len(chunks))
+        with instrument.stage('export'), open(name, 'w') as f:
+            json.dump(chunk, f, separators=(',', ':'))
+        chunks.append(os.path.basename(name))
+
+    for c in changes:
+        contents = c['contents']
+        if len(chunk) % keyframeInterval == 0:
+            chunk.append({'k': contents})
+        else:
+            chunk.append({'d': {k: deltaOps(prev.get(k, ''), v)
+                                for (k, v) in contents.items() if prev.get(k) != v}})
+        frames.append({k: v for (k, v) in c.items() if k in playbackFields})
+        prev = contents
+        if len(chunk) == chunkSize:
+            flush()
+            chunk = []
+    if chunk:
+        flush()
+
+    index = {'format': formatName, 'version': formatVersion,
+             'keyframeInterval': keyframeInterval, 'chunkSize': chunkSize,
+             'count': len(frames), 'frames': frames, 'chunks': chunks}
+    with open(filename, 'w') as f:
+        json.dump(index, f)
+    return index
+
+class PlaybackReader:
+    "Rebuilds any snapshot of a playback file, loading chunks as they are needed."
+
+    def __init__(self, filename):
+        with open(filename) as f:
+            self.index = json.load(f)
+        if self.index.get('format') != formatName:
+            raise ValueError(filename + ' is not a ' + formatName + ' playback file')
+        self.folder = os.path.dirname(os.path.abspath(filename))
+        self.chunkNumber = None
+        self.chunk = None
+
+    def __len__(self):
+        return self.index['count']
+
+    def loadChunk(self, n):
+        if self.chunkNumber != n:
+            with open(os.path.join(self.folder, self.index['chunks'][n])) as f:
+                self.chunk = json.load(f)
+            self.chunkNumber = n
+        return self.chunk
+
+    def contents(self, i):
+        "Returns the contents dict of frame i, as the commit had it."
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        size = self.index['chunkSize']
+        interval = self.index['keyframeInterval']
+        chunk = self.loadChunk(i // size)
+        pos = i % size
+        key = pos - pos % interval
+        contents = dict(chunk[key]['k'])
+        for frame in chunk[key + 1:pos + 1]:
+            for (k, ops) in frame['d'].items():
+                contents[k] = applyOps(contents.get(k, ''), ops)
+        return contents
+
+    def frame(self, i):
+        "Frame i as exportJSONforPlayback would have written it."
+        f = dict(self.index['frames'][i])
+        f['contents'] = self.contents(i)
+        return f
+
+def verifyRoundTrip(changes, filename):
+    "True if every frame of filename decodes to the contents of the matching commit."
+    reader = PlaybackReader(filename)
+    count = 0
+    for i, c in enumerate(changes):
+        if reader.contents(i) != c['contents']:
+            print('Playback round trip differs at frame ' + str(i))
+            return False
+        count = count + 1
+    return count == len(reader)
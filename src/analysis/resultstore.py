@@ -0,0 +1,144 @@
+"Results store sharded per project, in place of whole-corpus saveVar/restoreVar pickles."
+# Layout of a store folder:
+#   index.jsonl                       one line per finished project: project, shard, commits, time
+#   shards/<user>/<project>.pickle.z  the project's commits, zlib-compressed pickle
+#   shards/<user>/<project>.lifetime.json   its lifetime.LifetimeIndex, when one was given
+# Shards are written to a temporary file and renamed into place, and only then
+# is the project's line appended to the index, so a crash mid-run leaves every
+# finished project intact and the unfinished one absent. Shards hold commits
+# without parsed trees or tables (main.heavyFields) and without the lazy diff,
+# which is rebuilt from the contents when a shard is loaded.
+#   store = ResultStore('results')
+#   main.processCorpus(projects, store=store)   # run again after a crash: skips finished projects
+#   allp = store.lazy()                         # list-like, loads a project when it is used
+import os
+import json
+import time
+import zlib
+import pickle
+import featureNames as names
+import xml_analyze as xml
+import lifetime
+
+# what a shard leaves out of each commit
+droppedFields = xml.parsedFields + ['diff']
+
+def compactCommit(commit):
+    return {k: v for (k, v) in commit.items() if k not in droppedFields}
+
+def restoreDiffs(changes):
+    "Gives each commit after the first the lazy blocks diff against its predecessor, as processProject did."
+    for prev, cur in zip(changes, changes[1:]):
+        if 'contents' in prev and 'contents' in cur and names.featureExtractionResults in cur:
+            cur['diff'] = xml.LazyDiff(prev['contents']['Screen1/blocks'], cur['contents']['Screen1/blocks'])
+    return changes
+
+class ResultStore:
+    "Per-project shards of processed commits under one folder, see the module comment."
+
+    def __init__(self, folder='results'):
+        self.folder = folder
+        self.indexPath = os.path.join(folder, 'index.jsonl')
+        self.index = {}
+        os.makedirs(folder, exist_ok=True)
+        if os.path.isfile(self.indexPath):
+            with open(self.indexPath) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue        # a line cut short by a crash
+                    self.index[entry['project']] = entry
+
+    def shardName(self, project):
+        user, name = project.rstrip('/').split('/')[-2:]
+        return os.path.join('shards', user, name)
+
+    def __contains__(self, project):
+        "Is the project finished, with its shard in place?"
+        entry = self.index.get(project)
+        return entry is not None and os.path.isfile(os.path.join(self.folder, entry['shard']))
+
+    def __len__(self):
+        return len(self.index)
+
+    def projects(self):
+        "Finished projects, in the order they were stored."
+        return [p for p in self.index if p in self]
+
+    def writeAtomically(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, project, changes, lifetimeIndex=None):
+        "Stores the processed commits of a project (replacing any earlier shard) and marks it finished."
+        base = self.shardName(project)
+        shard = base + '.pickle.z'
+        data = pickle.dumps([compactCommit(c) for c in changes], protocol=pickle.HIGHEST_PROTOCOL)
+        self.writeAtomically(os.path.join(self.folder, shard), zlib.compress(data))
+        if lifetimeIndex is not None:
+            self.writeAtomically(os.path.join(self.folder, base + '.lifetime.json'),
+                                 json.dumps(lifetimeIndex.toDict(), separators=(',', ':')).encode('utf-8'))
+        entry = {'project': project, 'shard': shard, 'commits': len(changes), 'time': int(time.time())}
+        with open(self.indexPath, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.index[project] = entry
+
+    def get(self, project):
+        "Loads the processed commits of a finished project."
+        with open(os.path.join(self.folder, self.index[project]['shard']), 'rb') as f:
+            return restoreDiffs(pickle.loads(zlib.decompress(f.read())))
+
+    def lifetime(self, project):
+        "The project's lifetime.LifetimeIndex, or None if none was stored."
+        path = os.path.join(self.folder, self.shardName(project) + '.lifetime.json')
+        if not os.path.isfile(path):
+            return None
+        return lifetime.LifetimeIndex.load(path)
+
+    def lazy(self, projects=None, transform=None):
+        "List-like view of the projects' commits (default: every finished project), loaded on use."
+        return LazyResults(self, self.projects() if projects is None else projects, transform)
+
+    def compact(self):
+        "Rewrites the index with one line per project."
+        data = ''.join(json.dumps(self.index[p]) + '\n' for p in self.projects())
+        self.writeAtomically(self.indexPath, data.encode('utf-8'))
+
+class LazyResults:
+    '''Sequence of per-project commit lists, like allp, that reads each shard only
+    when it is used (and keeps just the last one). transform, e.g.
+    main.reduceFieldChangesF, is applied to each project's commits as they load.'''
+
+    def __init__(self, store, projects, transform=None):
+        self.store = store
+        self.projectList = list(projects)
+        self.transform = transform
+        self.last = (None, None)
+
+    def __len__(self):
+        return len(self.projectList)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return LazyResults(self.store, self.projectList[i], self.transform)
+        project = self.projectList[i]
+        if self.last[0] != project:
+            changes = self.store.get(project)
+            if self.transform is not None:
+                changes = self.transform(changes)
+            self.last = (project, changes)
+        return self.last[1]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def importResults(allp, store):
+    "Moves results of the old kind (a list of per-project commit lists, e.g. from restoreVar) into a store."
+    for changes in allp:
+        if changes:
+            store.put(changes[0]['dir'], changes)
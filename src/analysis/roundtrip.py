@@ -0,0 +1,67 @@
+"Round-trip check of playbackfile on synthetic histories: every frame must decode to what was exported."
+# Processes a synthetic project (synthetic.py) with main.processProject,
+# writes it with playbackfile.exportPlayback under several keyframe intervals
+# and chunk sizes (small enough to give many chunks, and chunks that don't
+# end on a keyframe), then reads every frame back with PlaybackReader and
+# compares it to the frame main.exportJSONforPlayback writes for the commit.
+#   python roundtrip.py                 exit with status 1 if any frame differs
+#   python roundtrip.py --commits 300 --seeds 0 1 2
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import synthetic
+import main
+import playbackfile
+import snapcache
+
+# (keyframeInterval, chunkSize)
+defaultLayouts = [(7, 30), (20, 200), (1, 16), (50, 10), (5, 5)]
+
+def checkLayout(changes, folder, keyframeInterval, chunkSize):
+    "Exports changes with one layout and returns the numbers of the frames that differ."
+    filename = '%s/playback-%d-%d.json' % (folder, keyframeInterval, chunkSize)
+    index = playbackfile.exportPlayback(changes, filename, keyframeInterval, chunkSize)
+    expected = folder + '/expected.json'
+    main.exportJSONforPlayback(changes, expected)
+    with open(expected) as f:
+        expected = json.load(f)
+    reader = playbackfile.PlaybackReader(filename)
+    bad = [i for i in range(len(expected)) if reader.frame(i) != expected[i]]
+    if len(reader) != len(expected):
+        bad.append(len(reader))
+    if not playbackfile.verifyRoundTrip(changes, filename):
+        bad.append(-1)
+    print('interval %3d, chunk %3d: %d frames in %d chunks, %s'
+          % (keyframeInterval, chunkSize, len(reader), len(index['chunks']),
+             'ok' if not bad else '%d differ' % len(bad)))
+    return bad
+
+def runChecks(blocks=60, depth=4, commits=120, seeds=(0,), layouts=defaultLayouts):
+    "Returns True if every frame of every layout round-trips."
+    previousCache = snapcache.activeCache
+    snapcache.disableCache()
+    folder = tempfile.mkdtemp(prefix='roundtrip-')
+    ok = True
+    try:
+        for seed in seeds:
+            repo = synthetic.makeProject(folder, blocks, depth, commits, seed=seed, project='Seed%d' % seed)
+            changes = main.processProject(repo)
+            for (interval, size) in layouts:
+                ok = not checkLayout(changes, folder, interval, size) and ok
+    finally:
+        snapcache.activeCache = previousCache
+        shutil.rmtree(folder)
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that playback files decode to exactly what was exported.')
+    parser.add_argument('--blocks', type=int, default=60, help='program size, in blocks')
+    parser.add_argument('--depth', type=int, default=4, help='nesting depth of the programs')
+    parser.add_argument('--commits', type=int, default=120, help='commits per history')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help='one synthetic history per seed')
+    args = parser.parse_args()
+    if not runChecks(args.blocks, args.depth, args.commits, args.seeds):
+        print('Playback round trip FAILED')
+        sys.exit(1)
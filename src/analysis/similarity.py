@@ -0,0 +1,259 @@
+"Near-duplicate snapshots across projects, with MinHash signatures and an LSH index."
+# A snapshot is reduced to a set of shingles: for each block, the path of block
+# types (and the sockets between them) from the block up through its nearest
+# parent blocks, e.g. 'math_number<A<math_add<VALUE<controls_if', at every
+# length up to pathLength. Two programs built the same way share most shingles
+# whatever their block ids, positions or field texts, so the Jaccard similarity
+# of the shingle sets measures how alike their structure is.
+# MinHasher turns shingle sets into fixed-size signatures, a batch at a time
+# with NumPy; the share of equal entries of two signatures estimates the
+# Jaccard similarity. LSHIndex buckets signatures by bands, so finding the
+# snapshots near one (or clusters of near ones) only compares it to those that
+# share a bucket with it, not to the whole corpus.
+#   index = indexCorpus(allp, finalOnly=True)     keys are (project, commit hash)
+#   index.nearest(key, 5)                         [(key, estimated similarity)]
+#   index.clusters(0.8)                           groups of near-identical final programs
+#   index.nearestTo(index.hasher.signature(snapshotShingles(templateXML)))
+#                                                 snapshots close to the template
+import json
+import numpy as np
+import blocktable
+import blockparser
+import xml_analyze as xml
+
+pathLength = 3          # blocks per shingle path
+shingleCodes = {}       # shingle path -> 32 bit code, shared by every call
+
+def shingleCode(path):
+    code = shingleCodes.get(path)
+    if code is None:
+        code = blocktable.digest(path) & 0xffffffff
+        shingleCodes[path] = code
+    return code
+
+def shingles(table, length=pathLength):
+    "Set of shingle codes of a BlockTable, as a sorted uint32 array."
+    codes = set()
+    types = table.types
+    parent = table.parent
+    socket = table.socket
+    for r in range(len(types)):
+        path = str(types[r])
+        codes.add(shingleCode(path))
+        row = r
+        for _ in range(length - 1):
+            p = parent[row]
+            if p < 0:
+                break
+            path = path + '<' + str(socket[row]) + '<' + str(types[p])
+            codes.add(shingleCode(path))
+            row = p
+    return np.array(sorted(codes), dtype=np.uint32)
+
+def snapshotShingles(snapshot, length=pathLength):
+    '''Shingles of a commit (from its table, or else its contents), a parsed
+    snapshot dict, a BlockTable, or blocks XML text. Unparseable XML has none.'''
+    if isinstance(snapshot, blocktable.BlockTable):
+        return shingles(snapshot, length)
+    if isinstance(snapshot, dict):
+        if 'table' in snapshot:
+            return shingles(snapshot['table'], length)
+        snapshot = snapshot['contents']['Screen1/blocks']
+    if not snapshot:
+        return np.zeros(0, dtype=np.uint32)
+    try:
+        table = blockparser.parseTable(xml.fixTrailingChars(snapshot))
+    except blockparser.parseErrors:
+        return np.zeros(0, dtype=np.uint32)
+    return shingles(table, length)
+
+class MinHasher:
+    '''numPerm multiply-add-shift hash functions ((a * x + b) mod 2^64) >> 32 over
+    32 bit shingle codes, a odd. Unlike hashing mod a prime, this needs no
+    division, which made up most of the time of a signature.
+    Hashers with the same numPerm and seed give comparable signatures.'''
+
+    def __init__(self, numPerm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        words = rng.randint(0, 2**32, size=(4, numPerm), dtype=np.uint64)
+        self.a = (words[0] << np.uint64(32)) | words[1] | np.uint64(1)
+        self.b = (words[2] << np.uint64(32)) | words[3]
+        self.numPerm = numPerm
+        self.seed = seed
+
+    def signature(self, codes):
+        return self.signatures([codes])[0]
+
+    def signatures(self, shingleSets, chunk=1024):
+        '''Signatures of many shingle sets, as a len(shingleSets) x numPerm uint32
+        array. Every hash of every shingle is computed in one array operation
+        per chunk of about chunk shingles. An empty set gets all 0xffffffff.'''
+        result = np.full((len(shingleSets), self.numPerm), 0xffffffff, dtype=np.uint32)
+        start = 0
+        while start < len(shingleSets):
+            # the sets from start to end, at least one, about chunk shingles together
+            end = start
+            total = 0
+            while end < len(shingleSets) and (end == start or total + len(shingleSets[end]) <= chunk):
+                total = total + len(shingleSets[end])
+                end = end + 1
+            sizes = np.array([len(s) for s in shingleSets[start:end]])
+            nonEmpty = np.flatnonzero(sizes)
+            if len(nonEmpty):
+                x = np.concatenate([shingleSets[start + i] for i in nonEmpty]).astype(np.uint64)
+                hashes = ((self.a[:, None] * x[None, :] + self.b[:, None]) >> np.uint64(32)).astype(np.uint32)
+                offsets = np.concatenate(([0], np.cumsum(sizes[nonEmpty])[:-1]))
+                result[start + nonEmpty] = np.minimum.reduceat(hashes, offsets, axis=1).T
+            start = end
+        return result
+
+def similarity(sigA, sigB):
+    "Estimated Jaccard similarity of the shingle sets behind two signatures."
+    return float(np.mean(sigA == sigB))
+
+class LSHIndex:
+    '''Signatures under keys, bucketed by bands of rows entries each. Two snapshots
+    of similarity s share a bucket with probability 1 - (1 - s^rows)^bands; the
+    default 32 bands of 4 mostly find pairs above 0.5 and rarely those below 0.2.'''
+
+    def __init__(self, hasher=None, bands=32, rows=4):
+        self.hasher = hasher if hasher is not None else MinHasher(bands * rows)
+        if bands * rows != self.hasher.numPerm:
+            raise ValueError('bands * rows must equal the number of hashes, %d' % self.hasher.numPerm)
+        self.bands = bands
+        self.rows = rows
+        self.keys = []
+        self.row = {}           # key -> row of its signature
+        self.buckets = [{} for _ in range(bands)]
+        self.sigs = []          # signature arrays, stacked into matrix when queried
+        self.matrix = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.row
+
+    def bandKeys(self, sig):
+        r = self.rows
+        return [sig[b * r:(b + 1) * r].tobytes() for b in range(self.bands)]
+
+    def add(self, key, sig):
+        "Adds a signature under a new key."
+        n = len(self.keys)
+        self.keys.append(key)
+        self.row[key] = n
+        for bucket, band in zip(self.buckets, self.bandKeys(sig)):
+            bucket.setdefault(band, []).append(n)
+        self.sigs.append(np.asarray(sig, dtype=np.uint32))
+        self.matrix = None
+
+    def addShingles(self, keys, shingleSets):
+        "Adds many snapshots at once, with their signatures computed in one batch."
+        for key, sig in zip(keys, self.hasher.signatures(shingleSets)):
+            self.add(key, sig)
+
+    def signatures(self):
+        if self.matrix is None:
+            self.matrix = np.array(self.sigs, dtype=np.uint32).reshape(len(self.sigs), self.hasher.numPerm)
+        return self.matrix
+
+    def signatureOf(self, key):
+        return self.signatures()[self.row[key]]
+
+    def candidates(self, sig):
+        "Rows that share at least one bucket with the signature."
+        rows = set()
+        for bucket, band in zip(self.buckets, self.bandKeys(sig)):
+            rows.update(bucket.get(band, ()))
+        return rows
+
+    def nearestTo(self, query, n=10, threshold=0.0):
+        '''The n keys most similar to a signature, as (key, estimated similarity),
+        most similar first. Only bucket candidates are compared, so a key below
+        about 0.2 similar is seldom returned.'''
+        rows = np.array(sorted(self.candidates(query)), dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        sims = np.mean(self.signatures()[rows] == query, axis=1)
+        order = np.argsort(-sims, kind='stable')
+        return [(self.keys[rows[i]], float(sims[i])) for i in order[:n] if sims[i] >= threshold]
+
+    def nearest(self, key, n=10, threshold=0.0):
+        "The n other keys most similar to an indexed key, as in nearestTo."
+        found = self.nearestTo(self.signatureOf(key), n + 1, threshold)
+        return [f for f in found if f[0] != key][:n]
+
+    def clusters(self, threshold=0.8, minSize=2, maxPairs=64):
+        '''Groups of keys linked by estimated similarity >= threshold (single
+        linkage, over bucket candidates only), largest first. Keys with identical
+        signatures (e.g. every untouched copy of the template) are one node, so
+        they cost nothing extra. A bucket with more than maxPairs distinct
+        signatures is not compared pair by pair, but each to its first one.'''
+        sigs = self.signatures()
+        if len(sigs) == 0:
+            return []
+        distinct, node = np.unique(sigs, axis=0, return_inverse=True)
+        node = node.reshape(-1)
+        # union-find over the distinct signatures
+        root = list(range(len(distinct)))
+        def find(i):
+            while root[i] != i:
+                root[i] = root[root[i]]
+                i = root[i]
+            return i
+        for bucket in self.buckets:
+            for rows in bucket.values():
+                nodes = np.unique(node[rows])
+                if len(nodes) < 2:
+                    continue
+                if len(nodes) <= maxPairs:
+                    a, b = np.triu_indices(len(nodes), 1)
+                    a, b = nodes[a], nodes[b]
+                else:
+                    a, b = np.full(len(nodes) - 1, nodes[0]), nodes[1:]
+                close = np.mean(distinct[a] == distinct[b], axis=1) >= threshold
+                for (i, j) in zip(a[close], b[close]):
+                    ri, rj = find(i), find(j)
+                    if ri != rj:
+                        root[max(ri, rj)] = min(ri, rj)
+        groups = {}
+        for i in range(len(self.keys)):
+            groups.setdefault(find(node[i]), []).append(self.keys[i])
+        result = [g for g in groups.values() if len(g) >= minSize]
+        result.sort(key=lambda g: -len(g))
+        return result
+
+    def save(self, filename):
+        "Saves keys and signatures (.npz); buckets are rebuilt on load."
+        np.savez_compressed(filename, sigs=self.signatures(), keys=np.array(json.dumps(self.keys)),
+                            params=np.array([self.bands, self.rows, self.hasher.seed]))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as d:
+            bands, rows, seed = (int(v) for v in d['params'])
+            index = cls(MinHasher(bands * rows, seed), bands, rows)
+            for key, sig in zip(json.loads(str(d['keys'])), d['sigs']):
+                index.add(tuple(key) if isinstance(key, list) else key, sig)
+        return index
+
+def indexCorpus(allp, index=None, finalOnly=False, length=pathLength):
+    '''Indexes the snapshots of processed projects (allp, or a results store's
+    lazy view) under (project, commit hash), one project's batch at a time.
+    Commits need their contents (or a table). finalOnly: just each project's last commit.'''
+    if index is None:
+        index = LSHIndex()
+    for changes in allp:
+        commits = changes[-1:] if finalOnly else changes
+        keys, sets = [], []
+        prevText, prevSet = None, None
+        for c in commits:
+            text = c['contents']['Screen1/blocks'] if 'contents' in c else None
+            if text is None or text != prevText:
+                prevSet = snapshotShingles(c, length)
+                prevText = text
+            keys.append((c['dir'], c['hash']))
+            sets.append(prevSet)
+        index.addShingles(keys, sets)
+    return index
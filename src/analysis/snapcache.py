@@ -0,0 +1,141 @@
+"On-disk cache of parsed snapshots and extracted features, keyed by git blob SHA."
+import os
+import pickle
+import collections
+
+# Stamp written into every cache folder. Bump it whenever parsing or the
+# detectors change what they produce: a cache with another stamp is wiped.
+CACHE_VERSION = 6
+
+class SnapshotCache:
+    """Content-addressed store shared by every commit and project using the same folder.
+    Snapshots are keyed by the SHA of their Screen1/blocks.xml blob, so identical
+    programs (template starts, saves without block edits) are parsed once per corpus.
+    Extracted features are keyed by the (previous, current) pair of blob SHAs.
+    When the folder grows past maxBytes, the least recently used entries are removed."""
+
+    def __init__(self, folder='snapshot-cache', maxBytes=2 * 1024 ** 3, memoryItems=64):
+        self.folder = os.path.abspath(folder)
+        self.maxBytes = maxBytes
+        self.memoryItems = memoryItems
+        self.memory = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.checkVersion()
+        self.size = sum(size for (_, size, _) in self.listEntries())
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def checkVersion(self):
+        "Empties the cache folder if it was written under another CACHE_VERSION."
+        stampFile = os.path.join(self.folder, 'VERSION')
+        if os.path.isfile(stampFile):
+            with open(stampFile) as f:
+                if f.read().strip() == str(CACHE_VERSION):
+                    return
+            print('Snapshot cache version changed, clearing ' + self.folder)
+            for (path, _, _) in self.listEntries():
+                os.remove(path)
+        os.makedirs(self.folder, exist_ok=True)
+        with open(stampFile, 'w') as f:
+            f.write(str(CACHE_VERSION) + '\n')
+
+    def listEntries(self):
+        "Returns (path, size, mtime) for every entry on disk."
+        entries = []
+        for kind in ['snapshots', 'changes']:
+            top = os.path.join(self.folder, kind)
+            if not os.path.isdir(top):
+                continue
+            for sub in os.scandir(top):
+                for e in os.scandir(sub.path):
+                    st = e.stat()
+                    entries.append((e.path, st.st_size, st.st_mtime))
+        return entries
+
+    def path(self, kind, key):
+        return os.path.join(self.folder, kind, key[:2], key + '.pickle')
+
+    def get(self, kind, key):
+        "Returns the cached value, or None."
+        memkey = (kind, key)
+        if memkey in self.memory:
+            self.memory.move_to_end(memkey)
+            self.hits = self.hits + 1
+            return self.memory[memkey]
+        p = self.path(kind, key)
+        try:
+            with open(p, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(p)     # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.remember(memkey, value)
+        return value
+
+    def put(self, kind, key, value):
+        self.remember((kind, key), value)
+        p = self.path(kind, key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        # write then rename, so parallel workers never read a half-written entry
+        tmp = p + '.' + str(os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        self.size = self.size + os.path.getsize(tmp)
+        os.replace(tmp, p)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def remember(self, memkey, value):
+        self.memory[memkey] = value
+        self.memory.move_to_end(memkey)
+        while len(self.memory) > self.memoryItems:
+            self.memory.popitem(last=False)
+
+    def evict(self):
+        "Removes least recently used entries until the cache is below 90% of maxBytes."
+        entries = sorted(self.listEntries(), key=lambda e: e[2])
+        self.size = sum(size for (_, size, _) in entries)
+        target = self.maxBytes * 0.9
+        for (path, size, _) in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass    # another worker got there first
+            self.size = self.size - size
+
+    # parsed snapshot of one blocks blob, by kind (blockparser.cacheKind):
+    # 'tree' {'etree', 'IDmap', 'parentmap', 'table'}, or 'table' {'table'}
+    def getSnapshot(self, blobSHA, kind='tree'):
+        return self.get('snapshots', blobSHA + '-' + kind)
+
+    def putSnapshot(self, blobSHA, kind, snapshot):
+        self.put('snapshots', blobSHA + '-' + kind, snapshot)
+
+    # features dict extracted between two blocks blobs
+    def getChanges(self, prevSHA, curSHA):
+        return self.get('changes', prevSHA + '-' + curSHA)
+
+    def putChanges(self, prevSHA, curSHA, features):
+        self.put('changes', prevSHA + '-' + curSHA, features)
+
+# The cache used by xml_analyze.loadChangeContents and main.extractChanges.
+# None means caching is off.
+activeCache = None
+
+def enableCache(folder='snapshot-cache', maxBytes=2 * 1024 ** 3):
+    global activeCache
+    activeCache = SnapshotCache(folder, maxBytes)
+    return activeCache
+
+def disableCache():
+    global activeCache
+    activeCache = None
+
+def blocksSHA(commit):
+    "Returns the blob SHA of the commit's Screen1/blocks.xml, if it is known."
+    return commit.get('blobs', {}).get('Screen1/blocks')
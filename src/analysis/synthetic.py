@@ -0,0 +1,252 @@
+"Synthetic App Inventor blocks histories in throwaway git repos, for benchmarks and checks."
+# A history starts from a random program of about `blocks` blocks (event
+# handlers holding statement chains, with value blocks plugged into sockets,
+# nested up to `depth`) and applies `commits` random edits, saving a snapshot
+# after each, like the snapshot service does. The edit mix is a dict of
+# weights, by default close to what students do:
+#   move      drag a top-level stack somewhere else on the workspace
+#   context   unplug a block (with what hangs off it) and plug it in elsewhere
+#   field     type one character into a field (char-by-char text edits)
+#   add       drag a new block out of the drawer
+#   delete    delete a block and what's plugged into it
+#   none      save without changing the blocks (e.g. a designer edit)
+# The repo is written with git fast-import, at <folder>/<user>/<project>.git,
+# the layout processProject expects.
+import os
+import random
+import subprocess
+from xml.sax.saxutils import escape
+
+defaultMix = {'move': 3, 'context': 2, 'field': 8, 'add': 3, 'delete': 1, 'none': 2}
+
+statementTypes = ['text_speak', 'set_label', 'controls_if', 'local_declaration']
+valueTypes = ['text', 'math_number', 'logic_boolean', 'text_join', 'math_add', 'lexical_variable_get']
+# value sockets and field of each block type; statement blocks with a DO socket take a chain
+sockets = {'text_speak': ['MESSAGE'], 'set_label': ['VALUE'], 'controls_if': ['IF0'],
+           'local_declaration': ['DECL0'], 'text_join': ['ADD0', 'ADD1'], 'math_add': ['NUM0', 'NUM1'],
+           'text': [], 'math_number': [], 'logic_boolean': [], 'lexical_variable_get': []}
+fieldNames = {'text': 'TEXT', 'math_number': 'NUM', 'logic_boolean': 'BOOL',
+              'lexical_variable_get': 'VAR', 'local_declaration': 'VAR0', 'set_label': 'PROP'}
+bodies = {'controls_if': 'DO0', 'local_declaration': 'STACK'}
+
+class Block:
+    "A block of the synthetic program."
+
+    def __init__(self, blockID, kind, rng):
+        self.id = blockID
+        self.kind = kind
+        self.field = None
+        if kind in fieldNames:
+            self.field = rng.choice(['hello', 'x', '0', 'true', 'Label1', 'count'])
+        self.values = {name: None for name in sockets.get(kind, [])}
+        self.body = None        # first block of a statement chain, for bodies/event handlers
+        self.next = None        # next statement in the chain
+        self.x = None
+        self.y = None
+
+    def children(self):
+        "Blocks directly plugged into this one."
+        kids = [b for b in self.values.values() if b is not None]
+        if self.body is not None:
+            kids.append(self.body)
+        if self.next is not None:
+            kids.append(self.next)
+        return kids
+
+    def toXML(self, out, indent):
+        pad = '  ' * indent
+        pos = '' if self.x is None else ' x="%d" y="%d"' % (self.x, self.y)
+        out.append('%s<block type="%s" id="%s"%s>' % (pad, self.kind, self.id, pos))
+        if self.kind == 'component_event':
+            out.append(pad + '  <mutation component_type="Button" instance_name="%s" event_name="Click"></mutation>' % self.field)
+            out.append(pad + '  <field name="COMPONENT_SELECTOR">%s</field>' % escape(self.field))
+        elif self.kind in ('text_join', 'math_add'):
+            out.append(pad + '  <mutation items="%d"></mutation>' % len(self.values))
+        if self.kind in fieldNames:
+            out.append('%s  <field name="%s">%s</field>' % (pad, fieldNames[self.kind], escape(self.field)))
+        for name, b in self.values.items():
+            if b is not None:
+                out.append('%s  <value name="%s">' % (pad, name))
+                b.toXML(out, indent + 2)
+                out.append(pad + '  </value>')
+        if self.body is not None:
+            out.append('%s  <statement name="%s">' % (pad, bodies.get(self.kind, 'DO')))
+            self.body.toXML(out, indent + 2)
+            out.append(pad + '  </statement>')
+        if self.next is not None:
+            out.append(pad + '  <next>')
+            self.next.toXML(out, indent + 2)
+            out.append(pad + '  </next>')
+        out.append(pad + '</block>')
+
+class Program:
+    "A workspace of top-level stacks that can be edited at random."
+
+    def __init__(self, rng, blocks=100, depth=4):
+        self.rng = rng
+        self.depth = depth
+        self.nextID = 1
+        self.top = []
+        handler = 0
+        while self.count() < blocks:
+            handler = handler + 1
+            event = self.newBlock('component_event')
+            event.field = 'Button%d' % handler
+            event.x, event.y = rng.randrange(0, 800), rng.randrange(0, 2000)
+            self.top.append(event)
+            prev = None
+            for _ in range(rng.randint(1, 6)):
+                s = self.newStatement(1)
+                if prev is None:
+                    event.body = s
+                else:
+                    prev.next = s
+                prev = s
+                if self.count() >= blocks:
+                    break
+
+    def newBlock(self, kind):
+        b = Block(str(self.nextID), kind, self.rng)
+        self.nextID = self.nextID + 1
+        return b
+
+    def newValue(self, level):
+        kinds = valueTypes if level < self.depth else [k for k in valueTypes if not sockets[k]]
+        b = self.newBlock(self.rng.choice(kinds))
+        for name in b.values:
+            b.values[name] = self.newValue(level + 1)
+        return b
+
+    def newStatement(self, level):
+        kinds = statementTypes if level < self.depth else ['text_speak', 'set_label']
+        b = self.newBlock(self.rng.choice(kinds))
+        for name in b.values:
+            b.values[name] = self.newValue(level + 1)
+        if b.kind in bodies and level < self.depth:
+            b.body = self.newStatement(level + 1)
+        return b
+
+    def allBlocks(self):
+        "Returns (block, parent) for every block, parent None for top-level blocks."
+        found = []
+        stack = [(b, None) for b in self.top]
+        while stack:
+            b, parent = stack.pop()
+            found.append((b, parent))
+            stack.extend((c, b) for c in b.children())
+        return found
+
+    def count(self):
+        return len(self.allBlocks())
+
+    def toXML(self):
+        out = ['<xml xmlns="http://www.w3.org/1999/xhtml">']
+        for b in self.top:
+            b.toXML(out, 1)
+        out.append('  <yacodeblocks ya-version="159" language-version="21"></yacodeblocks>')
+        out.append('</xml>')
+        return '\n'.join(out)
+
+    def detach(self, block, parent):
+        "Unplugs block from parent (or the workspace)."
+        if parent is None:
+            self.top.remove(block)
+            return
+        for name, b in parent.values.items():
+            if b is block:
+                parent.values[name] = None
+        if parent.body is block:
+            parent.body = None
+        if parent.next is block:
+            parent.next = None
+
+    def emptySockets(self, exclude):
+        "Returns (block, socket name) of every empty value socket outside exclude's subtree."
+        skip = set()
+        stack = [exclude]
+        while stack:
+            b = stack.pop()
+            skip.add(b)
+            stack.extend(b.children())
+        return [(b, name) for (b, _) in self.allBlocks() if b not in skip
+                for (name, v) in b.values.items() if v is None]
+
+    def edit(self, kind):
+        "Applies one edit of the given kind, if the program has something to apply it to."
+        rng = self.rng
+        every = self.allBlocks()
+        if kind == 'move' and self.top:
+            b = rng.choice(self.top)
+            b.x = b.x + rng.randint(-50, 50)
+            b.y = b.y + rng.randint(-50, 50)
+        elif kind == 'field':
+            withFields = [b for (b, _) in every if b.field is not None and b.kind != 'component_event']
+            if withFields:
+                b = rng.choice(withFields)
+                b.field = b.field + rng.choice('abcdefghij0123456789 ')
+        elif kind == 'add':
+            values = [(b, name) for (b, _) in every for (name, v) in b.values.items() if v is None]
+            if values and rng.random() < 0.7:
+                b, name = rng.choice(values)
+                b.values[name] = self.newBlock(rng.choice(['text', 'math_number', 'logic_boolean']))
+            else:
+                b = self.newBlock(rng.choice(valueTypes))
+                b.x, b.y = rng.randrange(0, 800), rng.randrange(0, 2000)
+                self.top.append(b)
+        elif kind == 'delete' and len(every) > 1:
+            b, parent = rng.choice([(b, p) for (b, p) in every if b.kind != 'component_event'] or every)
+            self.detach(b, parent)
+            if b.next is not None and parent is not None and parent.next is None and parent.body is not b:
+                parent.next, b.next = b.next, None     # the chain closes up behind a deleted statement
+        elif kind == 'context':
+            candidates = [(b, p) for (b, p) in every if b.kind in valueTypes]
+            if candidates:
+                b, parent = rng.choice(candidates)
+                targets = self.emptySockets(b)
+                self.detach(b, parent)
+                if targets and rng.random() < 0.8:
+                    target, name = rng.choice(targets)
+                    target.values[name] = b
+                    b.x = b.y = None
+                else:
+                    b.x, b.y = rng.randrange(0, 800), rng.randrange(0, 2000)
+                    self.top.append(b)
+
+def generateHistory(blocks=100, depth=4, commits=100, mix=None, seed=0):
+    "Returns a list of blocks XML snapshots: the starting program, then one per edit."
+    rng = random.Random(seed)
+    mix = mix or defaultMix
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    program = Program(rng, blocks, depth)
+    snapshots = [program.toXML()]
+    for _ in range(commits - 1):
+        program.edit(rng.choices(kinds, weights)[0])
+        snapshots.append(program.toXML())
+    return snapshots
+
+formJSON = '{"authURL":["ai2.appinventor.mit.edu"],"YaVersion":"159","Source":"Form","Properties":{"$Name":"Screen1","$Type":"Form","$Version":"20","AboutScreen":"MSDEBUGACTIVITY","Title":"Screen1","Uuid":"0"}}'
+
+def writeRepo(snapshots, folder, user='SyntheticUser', project='SyntheticProject', start=1500000000, interval=7):
+    '''Writes snapshots as the history of <folder>/<user>/<project>.git, one commit each,
+    interval seconds apart. Returns the repo path.'''
+    repo = os.path.abspath(os.path.join(folder, user, project + '.git'))
+    os.makedirs(repo, exist_ok=True)
+    subprocess.run(['git', 'init', '-q', repo], check=True)
+    stream = []
+    form = formJSON.encode('utf-8')
+    for n, xml in enumerate(snapshots):
+        data = xml.encode('utf-8')
+        when = '%d +0000' % (start + n * interval)
+        stream.append(b'commit refs/heads/master\n')
+        stream.append(b'committer Snapshot <snapshot@localhost> ' + when.encode() + b'\n')
+        stream.append(b'data 8\nsnapshot\n')
+        stream.append(b'M 100644 inline Screen1/blocks.xml\ndata %d\n' % len(data) + data + b'\n')
+        if n == 0:
+            stream.append(b'M 100644 inline Screen1/form.json\ndata %d\n' % len(form) + form + b'\n')
+    subprocess.run(['git', 'fast-import', '--quiet'], input=b''.join(stream), cwd=repo, check=True)
+    return repo
+
+def makeProject(folder, blocks=100, depth=4, commits=100, mix=None, seed=0, user='SyntheticUser', project='SyntheticProject'):
+    "generateHistory and writeRepo in one go. Returns the repo path."
+    return writeRepo(generateHistory(blocks, depth, commits, mix, seed), folder, user, project)
@@ -0,0 +1,120 @@
+"Sorted time index over processed commits, for range queries across projects."
+# Commits are numbered in the order they are given (flattened), which is also
+# the row order of featurematrix.FeatureMatrix, so the row numbers returned
+# here point straight into a matrix built from the same commits.
+#   t = TimeIndex.fromChanges(allp)
+#   t.elapsedBetween(600, 900)      rows of every commit in minutes 10-15 of its project
+#   t.between(start, end)           rows of every commit between two unix times
+#   t.windowCounts(60)              commits per minute of activity time
+#   t.sessions(300)                 work sessions split at 5 minutes of inactivity
+# Range lookups are a bisect on a sorted key array, O(log n + k).
+from array import array
+from bisect import bisect_left
+from columnar import flatten
+
+class SortedKeys:
+    "A key per row, sorted, with the row each key came from."
+
+    def __init__(self, keys):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = array('q', (keys[r] for r in order))
+        self.rows = array('l', order)
+
+    def span(self, lo, hi):
+        "Positions in keys of lo <= key < hi."
+        return bisect_left(self.keys, lo), bisect_left(self.keys, hi)
+
+    def range(self, lo, hi):
+        "Rows with lo <= key < hi, in key order."
+        i, j = self.span(lo, hi)
+        return self.rows[i:j]
+
+    def count(self, lo, hi):
+        i, j = self.span(lo, hi)
+        return j - i
+
+class TimeIndex:
+    "Sorted date_unix and seconds_elapsed of commits, see the module comment."
+
+    def __init__(self, dateUnix, seconds, project):
+        self.dateUnix = array('q', dateUnix)
+        self.seconds = array('q', seconds)
+        self.project = project          # per row: a project key (its dir)
+        self.byDate = SortedKeys(self.dateUnix)
+        self.bySeconds = SortedKeys(self.seconds)
+
+    @classmethod
+    def fromChanges(cls, changes):
+        dates, seconds, project = [], [], []
+        for c in flatten(changes):
+            dates.append(int(c['date_unix']))
+            seconds.append(c.get('seconds_elapsed', 0))
+            project.append(c.get('dir', ''))
+        return cls(dates, seconds, project)
+
+    @classmethod
+    def fromMatrix(cls, matrix):
+        "Index over the rows of a featurematrix.FeatureMatrix."
+        return cls(matrix.dateUnix.tolist(), matrix.seconds.tolist(),
+                   [matrix.projects[p] for p in matrix.project.tolist()])
+
+    def __len__(self):
+        return len(self.dateUnix)
+
+    def between(self, start, end):
+        "Rows of commits with start <= date_unix < end."
+        return self.byDate.range(start, end)
+
+    def elapsedBetween(self, lo, hi):
+        "Rows of commits made lo <= seconds_elapsed < hi into their project."
+        return self.bySeconds.range(lo, hi)
+
+    def windowCounts(self, width, step=None, field='seconds_elapsed', start=None, end=None):
+        '''Number of commits in each window [t, t + width) for t = start, start + step, ...
+        up to end. Returns (window starts, counts); each count is O(log n).'''
+        keys = self.bySeconds if field == 'seconds_elapsed' else self.byDate
+        if len(keys.keys) == 0:
+            return [], []
+        step = step or width
+        start = keys.keys[0] if start is None else start
+        end = keys.keys[-1] + 1 if end is None else end
+        starts = list(range(start, end, step))
+        return starts, [keys.count(t, t + width) for t in starts]
+
+    def sessions(self, gap):
+        "Splits every project's commits into sessions wherever gap seconds pass without a commit."
+        return Sessions(self, gap)
+
+class Sessions:
+    '''Work sessions of all projects, sorted by start time. Each session is
+    (project, start date_unix, end date_unix, rows in time order).'''
+
+    def __init__(self, index, gap):
+        rowsOf = {}
+        for r in index.byDate.rows:
+            rowsOf.setdefault(index.project[r], []).append(r)
+        sessions = []
+        for project, rows in rowsOf.items():
+            current = [rows[0]]
+            for r in rows[1:]:
+                if index.dateUnix[r] - index.dateUnix[current[-1]] > gap:
+                    sessions.append((project, index.dateUnix[current[0]], index.dateUnix[current[-1]], current))
+                    current = []
+                current.append(r)
+            sessions.append((project, index.dateUnix[current[0]], index.dateUnix[current[-1]], current))
+        sessions.sort(key=lambda s: s[1])
+        self.sessions = sessions
+        self.starts = array('q', (s[1] for s in sessions))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __getitem__(self, i):
+        return self.sessions[i]
+
+    def startingBetween(self, start, end):
+        "Sessions that start with start <= date_unix < end."
+        return self.sessions[bisect_left(self.starts, start):bisect_left(self.starts, end)]
+
+    def ofProject(self, project):
+        return [s for s in self.sessions if s[0] == project]
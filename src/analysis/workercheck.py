@@ -0,0 +1,73 @@
+"Check that processCorpus workers started with spawn use the parent's snapshot cache and parser backend."
+# Under the spawn start method (the default on macOS and Windows) each worker
+# imports the analysis modules afresh, so settings made in the parent are only
+# there if processCorpus hands them over (main.initWorker). This runs a few
+# synthetic projects (synthetic.py) through processCorpus with spawn workers
+# with each cacheable blockparser backend, and checks that:
+#   - the workers wrote snapshot cache entries into the parent's cache folder,
+#     of the kind the backend stores (so they parsed with that backend)
+#   - the results are the same as from processing the projects in this process
+#   python workercheck.py               exit with status 1 if a check fails
+import sys
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+import synthetic
+import main
+import snapcache
+import blockparser
+
+def cacheEntries(folder, kind):
+    "Names of the cache entries of a kind ('snapshots' or 'changes') in folder."
+    cache = snapcache.SnapshotCache(folder)
+    return [path for (path, _, _) in cache.listEntries() if '/' + kind + '/' in path]
+
+def featuresOf(allp):
+    return [[(c['hash'], c.get('features')) for c in changes] for changes in allp]
+
+def runChecks(projects=3, blocks=40, commits=30, workers=2):
+    "Returns True if every check passes."
+    previousCache = snapcache.activeCache
+    previousBackend = blockparser.backend
+    previousMethod = multiprocessing.get_start_method(allow_none=True)
+    folder = tempfile.mkdtemp(prefix='workercheck-')
+    ok = True
+    try:
+        repos = [synthetic.makeProject(folder, blocks, 4, commits, seed=n, project='Seed%d' % n)
+                 for n in range(projects)]
+        snapcache.disableCache()
+        expected = featuresOf(main.processCorpus(repos, workers=1, reportEvery=0))
+
+        multiprocessing.set_start_method('spawn', force=True)
+        for backend in ['etree', 'stream']:
+            blockparser.setBackend(backend)
+            cacheFolder = folder + '/cache-' + backend
+            snapcache.enableCache(cacheFolder)
+            result = featuresOf(main.processCorpus(repos, workers=workers, reportEvery=0))
+            snapshots = cacheEntries(cacheFolder, 'snapshots')
+            suffix = '-' + blockparser.cacheKind() + '.pickle'
+            print('%s: spawn workers wrote %d snapshot cache entries' % (backend, len(snapshots)))
+            if not snapshots:
+                print('FAILED: the workers did not use the snapshot cache')
+                ok = False
+            if any(not path.endswith(suffix) for path in snapshots):
+                print('FAILED: the workers did not parse with the ' + backend + ' backend')
+                ok = False
+            if result != expected:
+                print('FAILED: spawn workers gave other results than processing in this process')
+                ok = False
+    finally:
+        multiprocessing.set_start_method(previousMethod, force=True)
+        snapcache.activeCache = previousCache
+        blockparser.setBackend(previousBackend)
+        shutil.rmtree(folder)
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that spawned processCorpus workers get the parent settings.')
+    parser.add_argument('--projects', type=int, default=3, help='synthetic projects to process')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+    if not runChecks(args.projects, workers=args.workers):
+        sys.exit(1)
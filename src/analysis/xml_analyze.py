@@ -1,13 +1,20 @@
 # https://docs.python.org/3/library/xml.etree.elementtree.html
 
 import xml.etree.ElementTree as ET
+import collections.abc
 import gitfilter as git
+import snapcache
+import blocktable
+import blockparser
 import difflib
+import linediff
+import instrument
 
 BLOCK = '{http://www.w3.org/1999/xhtml}block'
 ROOT = '{http://www.w3.org/1999/xhtml}xml'
 
 ns = '{http://www.w3.org/1999/xhtml}'
+FIELD = ns + 'field'
 
 def dens(tag):
     "De-namespace- removes the namespace prefix from a tag"
@@ -48,6 +55,40 @@ def makeIDtoBlockMap(treeroot):
     "Returns a map of block ID numbers -> block elements. (Only block-type nodes have IDs)"
     return {block.get('id'):block for block in treeroot.iter(BLOCK)}
 
+class LazyMap(collections.abc.Mapping):
+    '''An IDmap or parentmap of a parsed tree, built by make(etree) the first time
+    it is read. parseBlocks hands these out: the pipeline reads only the block
+    table, so most maps are never built. Pickled without the built map.'''
+    __slots__ = ['make', 'etree', 'map']
+
+    def __init__(self, make, etree):
+        self.make = make
+        self.etree = etree
+        self.map = None
+
+    def built(self):
+        "The map as a plain dict."
+        if self.map is None:
+            with instrument.stage('maps'):
+                self.map = self.make(self.etree)
+        return self.map
+
+    def __getitem__(self, key):
+        return self.built()[key]
+
+    def __iter__(self):
+        return iter(self.built())
+
+    def __len__(self):
+        return len(self.built())
+
+    def __getstate__(self):
+        return (self.make, self.etree)
+
+    def __setstate__(self, state):
+        self.make, self.etree = state
+        self.map = None
+
 def findParentBlock(element, parentMap):
     "Returns parent block OR root element (ROOT) if top level"
     while parentMap[element].tag != BLOCK and parentMap[element].tag != ROOT:
@@ -80,6 +121,47 @@ def fixTrailingChars(xmlString):
     end = '</xml>'
     return xmlString.split(end)[0] + end
 
+def parseBlocks(blocksXML, username, commit):
+    '''Parses blocks XML into its etree, IDmap, parentmap and compact block table,
+    or only the table with the 'stream' blockparser backend. The maps are
+    LazyMaps, built only if something reads them.'''
+    if not blockparser.buildsTree():
+        try:
+            with instrument.stage('parse'):
+                table = blockparser.parseTable(blocksXML)
+        except blockparser.parseErrors:
+            print('XML Parser Crash ' + username + ' ' + commit['dir'] + ' ' + commit['hash'] + '\n')
+            instrument.count('parse failures')
+            table = blocktable.BlockTable()
+        instrument.count('blocks parsed', len(table))
+        return {'table': table}
+    try:
+        with instrument.stage('parse'):
+            etree = blockparser.fromstring(blocksXML)
+    except blockparser.parseErrors:
+        print('XML Parser Crash ' + username + ' ' + commit['dir'] + ' ' + commit['hash'] + '\n')
+        instrument.count('parse failures')
+        etree = blockparser.fromstring("<xml><error>XML Parse Failed</error></xml>")
+    IDmap = LazyMap(makeIDtoBlockMap, etree)
+    parentmap = LazyMap(makeParentMap, etree)
+    with instrument.stage('block table'):
+        table = blocktable.BlockTable.fromTree(etree)
+    instrument.count('blocks parsed', len(table))
+    return {'etree': etree, 'IDmap': IDmap, 'parentmap': parentmap, 'table': table}
+
+def parseSnapshot(commit, username=''):
+    "Parses the commit's blocks, or takes them from the snapshot cache when enabled."
+    cache = snapcache.activeCache
+    sha = snapcache.blocksSHA(commit)
+    kind = blockparser.cacheKind()
+    if cache is None or sha is None or kind is None:
+        return parseBlocks(commit['contents']['Screen1/blocks'], username, commit)
+    snapshot = cache.getSnapshot(sha, kind)
+    if snapshot is None:
+        snapshot = parseBlocks(commit['contents']['Screen1/blocks'], username, commit)
+        cache.putSnapshot(sha, kind, snapshot)
+    return snapshot
+
 # function that loads data into a commit to prepare for testing.
 def loadChangeContents(commit, username='', start_time=0):
     "Returns True if the commit had empty blocks and should be ignored."
@@ -87,25 +169,44 @@ def loadChangeContents(commit, username='', start_time=0):
 
     ### Corruption Tests ###
     # fix a class of data corruption: appended junk
-    commit['contents']['Screen1/blocks'] = fixTrailingChars(commit['contents']['Screen1/blocks'])
+    with instrument.stage('fixTrailingChars'):
+        commit['contents']['Screen1/blocks'] = fixTrailingChars(commit['contents']['Screen1/blocks'])
     # detect a class of data corruption: empty blocks
     if not commit['contents']['Screen1/blocks']:
+        instrument.count('empty blocks removed')
         return True
     
-    try:
-        commit['etree'] = ET.fromstring(commit['contents']['Screen1/blocks'])
-    except ET.ParseError:
-        print('XML Parser Crash ' + username + ' ' + commit['dir'] + ' ' + commit['hash'] + '\n')
-        commit['etree'] = ET.fromstring("<xml><error>XML Parse Failed</error></xml>")
-    commit['IDmap'] = makeIDtoBlockMap(commit['etree'])
-    commit['parentmap'] = makeParentMap(commit['etree'])
+    commit.update(parseSnapshot(commit, username))
+    stampCommit(commit, username, start_time)
+    return False
+
+# the fields loadChangeContents adds to a commit from parsing its blocks
+# (only the table with the 'stream' blockparser backend)
+parsedFields = ['etree', 'IDmap', 'parentmap', 'table']
+
+def loadUnchangedContents(commit, prevCommit, username='', start_time=0):
+    '''Loads a commit whose Screen1/blocks.xml blob is the same as that of prevCommit,
+    an already loaded commit. Blocks and their parsed snapshot are shared with
+    prevCommit instead of being read and parsed again; the form is read only if it changed.'''
+    contents = {'Screen1/blocks': prevCommit['contents']['Screen1/blocks']}
+    if commit['blobs'].get('Screen1/form') == prevCommit['blobs'].get('Screen1/form'):
+        contents['Screen1/form'] = prevCommit['contents']['Screen1/form']
+    else:
+        contents['Screen1/form'] = git.readFileAt(commit, 'Screen1/form')
+    commit['contents'] = contents
+    for k in parsedFields:
+        if k in prevCommit:
+            commit[k] = prevCommit[k]
+    stampCommit(commit, username, start_time)
+
+def stampCommit(commit, username='', start_time=0):
+    "Adds the username and seconds since the project's start to a commit."
     if username != '':
         commit['username'] = username
     if isinstance(start_time, str):
         start_time = int(start_time)
     if start_time != 0:
         commit['seconds_elapsed'] = int(commit['date_unix']) - start_time
-    return False
 
 # functionss to check for specific changes
 
@@ -245,10 +346,32 @@ def checkForFieldChanges(IDmapA, IDmapB):
     blockIDs = commonKeys(IDmapA, IDmapB)
     return [i for i in blockIDs if didThisBlocksFieldsChange(IDmapA[i], IDmapB[i])]
 
-def getBlocksDiff(prevChange, curChange):
-    textA = prevChange['contents']['Screen1/blocks'].split('\n')
-    textB = curChange['contents']['Screen1/blocks'].split('\n')
-    return list(difflib.Differ().compare(textA, textB))
+def getBlocksDiff(prevChange, curChange, fast=False):
+    "Line diff of the blocks of two commits. fast: Myers diff, without Differ's '?' lines."
+    return LazyDiff(prevChange['contents']['Screen1/blocks'],
+                    curChange['contents']['Screen1/blocks']).lines(fast)
+
+class LazyDiff:
+    """The blocks diff of a commit against its predecessor, computed only when asked for.
+    Holds the two blocks texts (shared with the commits' contents, not copied).
+    Iterating gives the difflib.Differ lines, as the old eager diff list did."""
+    __slots__ = ['textA', 'textB']
+
+    def __init__(self, textA, textB):
+        self.textA = textA
+        self.textB = textB
+
+    def lines(self, fast=False):
+        a = self.textA.split('\n')
+        b = self.textB.split('\n')
+        if fast:
+            with instrument.stage('diff (fast)'):
+                return linediff.compare(a, b)
+        with instrument.stage('diff'):
+            return list(difflib.Differ().compare(a, b))
+
+    def __iter__(self):
+        return iter(self.lines())
 
 ######## Testing Data ########
 if __name__ == '__main__':
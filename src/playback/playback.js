@@ -2,29 +2,95 @@
 
 goog.provide('Blockly.Playback');
 
+// Plays back either format written by the analysis code:
+//  - a JSON array of frames with full contents (exportJSONforPlayback)
+//  - a keyframe + delta index file (playbackfile.exportPlayback), whose chunk
+//    files are fetched and decoded only when a frame in them is shown.
 Blockly.Playback.start = function (filename){
     var history = [];
     var length = 0;
-    var current = 0;
+    var current = 0;        // frame on the workspace
+    var target = 0;         // frame last asked for; next and prev step from it
+    var index = null;       // keyframe + delta index, null for a plain array
+    var chunks = {};        // chunk number -> promise of that chunk's decoded contents
+    var folder = filename.substring(0, filename.lastIndexOf('/') + 1);
 
     var injectBlocks = function (blocksXML){
         Blockly.mainWorkspace.clear(); // Remove any existing blocks before we add new ones.
         Blockly.Xml.domToWorkspace(Blockly.mainWorkspace, Blockly.Xml.textToDom(blocksXML));
     };
 
+    // replace lines i1..i2 of the previous text with the op's lines, last op first
+    var applyOps = function (text, ops){
+        var lines = text.split('\n');
+        for (var n = ops.length - 1; n >= 0; n--) {
+            Array.prototype.splice.apply(lines, [ops[n][0], ops[n][1] - ops[n][0]].concat(ops[n][2]));
+        }
+        return lines.join('\n');
+    };
+
+    // a chunk starts with a keyframe, every other frame is a keyframe or a delta on the one before
+    var decodeChunk = function (frames){
+        var decoded = [];
+        var contents = {};
+        frames.forEach(function (frame){
+            if (frame.k) {
+                contents = frame.k;
+            } else {
+                var next = {};
+                Object.keys(contents).forEach(function (k){ next[k] = contents[k]; });
+                Object.keys(frame.d).forEach(function (k){ next[k] = applyOps(next[k] || '', frame.d[k]); });
+                contents = next;
+            }
+            decoded.push(contents);
+        });
+        return decoded;
+    };
+
+    var loadChunk = function (n){
+        if (!chunks[n]) {
+            chunks[n] = fetch("http://localhost:8000/" + folder + index.chunks[n])
+                .then(function(result){return result.json();})
+                .then(decodeChunk);
+        }
+        return chunks[n];
+    };
+
+    var contentsOf = function (framenum){
+        if (index === null) {
+            return Promise.resolve(history[framenum - 1]['contents']);
+        }
+        var i = framenum - 1;
+        return loadChunk(Math.floor(i / index.chunkSize))
+            .then(function(decoded){return decoded[i % index.chunkSize];});
+    };
+
+    // Chunks load asynchronously: only the frame asked for last is shown, so
+    // an earlier request that resolves late never replaces a newer frame.
     var load = function (framenum){
         if (framenum <= length && framenum > 0) {
-            injectBlocks(history[framenum - 1]['contents']['Screen1/blocks']);
-            current = framenum;
+            target = framenum;
+            contentsOf(framenum).then(function(contents){
+                if (framenum !== target) {
+                    return;
+                }
+                injectBlocks(contents['Screen1/blocks']);
+                current = framenum;
+                console.log("Frame " + current + " of " + length + "   time: " + history[framenum - 1]['seconds_elapsed']);
+            });
         }
-        console.log("Frame " + current + " of " + length + "   time: " + history[framenum - 1]['seconds_elapsed']);
     };
 
     var loadProjectFile = function (){
         fetch("http://localhost:8000/" + filename)
             .then(function(result){return result.json();})
             .then(function(jsontext){
-                history = jsontext;
+                if (Array.isArray(jsontext)) {
+                    history = jsontext;
+                } else {
+                    index = jsontext;
+                    history = index.frames;
+                }
                 length = history.length;
                 load(1);
             });
@@ -35,8 +101,8 @@ Blockly.Playback.start = function (filename){
     return {
         length: function () { return length },
         load: load,
-        next: function () { load( current + 1 ) },
-        prev: function () { load( current - 1 ) }
+        next: function () { load( target + 1 ) },
+        prev: function () { load( target - 1 ) }
     };
 
 };